@@ -0,0 +1,479 @@
+# Copyright 2026 Cisco Systems, Inc. and its affiliates
+#
+# SPDX-License-Identifier: MIT
+
+"""
+収集処理 (get_all_inventory) のベンチマーク。
+ACI / Meraki / Catalyst Center / SD-WAN の API を模したローカルHTTPサーバーを別プロセスで起動し、
+N コントローラ x M 台の構成で実際の Core の取得処理を計測する。
+
+    python multidomain_inventory_bench.py --controllers 4 --devices 5000 --latency 20
+    python multidomain_inventory_bench.py --domains aci catalyst --throttle-rate 0.05 --json
+
+--startup では各エントリポイントの import 時間を `python -X importtime` で計測し、予算と比較する。
+
+    python multidomain_inventory_bench.py --startup
+    python multidomain_inventory_bench.py --startup --budget multidomain_inventory_mcp=800
+"""
+
+import gc
+import sys
+import json
+import time
+import random
+import argparse
+import statistics
+import subprocess
+import tracemalloc
+import multiprocessing
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+import multidomain_inventory_core as core
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+DOMAIN_ARGS = {"aci": "ACI", "meraki": "MERAKI", "catalyst": "CATALYST", "sdwan": "SDWAN"}
+
+# ==============================================================================
+# Mock Controllers
+# コントローラを模したHTTPサーバー（パスの先頭でコントローラを区別: /aci0/api/..., /meraki1/api/v1/...）
+# ==============================================================================
+
+ACI_TOKEN = "bench-apic-token"
+CATALYST_TOKEN = "bench-dnac-token"
+SDWAN_SESSION = "bench-jsessionid"
+VMANAGE_LOGIN_PAGE = b"<html><body>vManage login</body></html>"
+
+def aci_node(ctrl, i):
+    return {"fabricNode": {"attributes": {
+        "dn": f"topology/pod-1/node-{101 + i}",
+        "name": f"{ctrl}-leaf{i}",
+        "fabricSt": "inactive" if i % 50 == 49 else "active",
+        "model": "N9K-C93180YC-FX" if i % 8 else "N9K-C9364C",
+        "serial": f"FDO{ctrl.upper()}{i:07d}",
+        "version": "n9000-16.0(3b)",
+        "address": f"10.0.{(i >> 8) & 255}.{i & 255}",
+    }}}
+
+def meraki_device(ctrl, i):
+    return {
+        "serial": f"Q2{ctrl.upper()}-{i:06d}",
+        "name": f"{ctrl}-mr{i}",
+        "model": ("MR46", "MS120-8", "MX68")[i % 3],
+        "firmware": "wireless-29-7",
+        "lanIp": f"192.168.{(i >> 8) & 255}.{i & 255}",
+    }
+
+def meraki_status(ctrl, i):
+    return {"serial": f"Q2{ctrl.upper()}-{i:06d}", "status": ("online", "online", "offline", "alerting")[i % 4]}
+
+def catalyst_device(ctrl, i):
+    return {
+        "id": f"{ctrl}-{i:08d}-0000-0000-0000-000000000000",
+        "hostname": f"{ctrl}-c9k{i}",
+        "reachabilityStatus": "Unreachable" if i % 40 == 39 else "Reachable",
+        "platformId": "C9300-48P",
+        "serialNumber": f"FOC{ctrl.upper()}{i:07d}",
+        "softwareVersion": "17.9.4a",
+        "managementIpAddress": f"10.1.{(i >> 8) & 255}.{i & 255}",
+    }
+
+def sdwan_device(ctrl, i):
+    return {
+        "uuid": f"C8K-{ctrl}-{i:08d}",
+        "host-name": f"{ctrl}-edge{i}",
+        "status": "normal" if i % 30 else "error",
+        "device-model": "vedge-C8000V",
+        "version": "17.12.02",
+        "system-ip": f"172.16.{(i >> 8) & 255}.{i & 255}",
+    }
+
+class MockControllerHandler(BaseHTTPRequestHandler):
+    """
+    Core が呼び出すエンドポイントだけを実装したスタンドイン。
+    server.options の latency / error_rate / throttle_rate / retry_after / devices に従って応答する。
+    """
+    protocol_version = "HTTP/1.1"  # Keep-Alive を有効にする
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.dispatch()
+
+    def do_POST(self):
+        self.dispatch()
+
+    def send_body(self, status, body, content_type="application/json", headers=None):
+        if not isinstance(body, bytes):
+            body = json.dumps(body, separators=(",", ":")).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def dispatch(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            self.rfile.read(length)
+        opts = self.server.options
+        if opts["latency"]:
+            time.sleep(opts["latency"])
+        roll = random.random()
+        if roll < opts["throttle_rate"]:
+            return self.send_body(429, {"errors": ["Too Many Requests"]},
+                                  headers={"Retry-After": str(opts["retry_after"])})
+        if roll < opts["throttle_rate"] + opts["error_rate"]:
+            return self.send_body(503, {"errors": ["Service Unavailable"]})
+
+        url = urlsplit(self.path)
+        _, ctrl, path = (url.path.split("/", 2) + [""])[:3]
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        handler = getattr(self, f"handle_{ctrl.rstrip('0123456789')}", None)
+        if handler is None:
+            return self.send_body(404, {"error": "unknown controller"})
+        return handler(ctrl, "/" + path, query)
+
+    # --- ACI (APIC) ---
+    def handle_aci(self, ctrl, path, query):
+        if path in ("/api/aaaLogin.json", "/api/aaaRefresh.json"):
+            return self.send_body(200, {"imdata": [{"aaaLogin": {"attributes": {
+                "token": ACI_TOKEN, "refreshTimeoutSeconds": "600"}}}]},
+                headers={"Set-Cookie": f"APIC-cookie={ACI_TOKEN}; Path=/"})
+        if f"APIC-cookie={ACI_TOKEN}" not in (self.headers.get("Cookie") or ""):
+            return self.send_body(403, {"imdata": [{"error": {"attributes": {"text": "Token was invalid"}}}]})
+        if path == "/api/node/class/fabricNode.json":
+            total = self.server.options["devices"]
+            size = int(query.get("page-size", 500))
+            start = int(query.get("page", 0)) * size
+            nodes = [aci_node(ctrl, i) for i in range(start, min(total, start + size))]
+            return self.send_body(200, {"totalCount": str(total), "imdata": nodes})
+        return self.send_body(404, {"imdata": []})
+
+    # --- Meraki Dashboard API ---
+    def handle_meraki(self, ctrl, path, query):
+        if not self.headers.get("X-Cisco-Meraki-API-Key"):
+            return self.send_body(401, {"errors": ["Invalid API key"]})
+        parts = path.strip("/").split("/")  # api/v1/organizations/{org}/devices[/statuses]
+        if parts[:3] != ["api", "v1", "organizations"] or len(parts) < 5 or parts[4] != "devices":
+            return self.send_body(404, {"errors": ["Not found"]})
+        make = meraki_status if parts[5:] == ["statuses"] else meraki_device
+        total = self.server.options["devices"]
+        per_page = int(query.get("perPage", 1000))
+        start = int(query.get("startingAfter", -1)) + 1
+        end = min(total, start + per_page)
+        headers = {}
+        if end < total:
+            next_url = (f"http://{self.headers.get('Host')}/{ctrl}{path}"
+                        f"?perPage={per_page}&startingAfter={end - 1}")
+            headers["Link"] = f'<{next_url}>; rel=next'
+        return self.send_body(200, [make(ctrl, i) for i in range(start, end)], headers=headers)
+
+    # --- Catalyst Center ---
+    def handle_catalyst(self, ctrl, path, query):
+        if path == "/dna/system/api/v1/auth/token":
+            return self.send_body(200, {"Token": CATALYST_TOKEN})
+        if self.headers.get("X-Auth-Token") != CATALYST_TOKEN:
+            return self.send_body(401, {"error": "Unauthorized"})
+        total = self.server.options["devices"]
+        if path == "/dna/intent/api/v1/network-device/count":
+            return self.send_body(200, {"response": total, "version": "1.0"})
+        if path == "/dna/intent/api/v1/network-device":
+            start = int(query.get("offset", 1)) - 1
+            end = min(total, start + int(query.get("limit", 500)))
+            return self.send_body(200, {"response": [catalyst_device(ctrl, i) for i in range(start, end)]})
+        return self.send_body(404, {"error": "Not found"})
+
+    # --- SD-WAN Manager (vManage) ---
+    def handle_sdwan(self, ctrl, path, query):
+        if path == "/j_security_check":
+            return self.send_body(200, b"", content_type="text/plain",
+                                  headers={"Set-Cookie": f"JSESSIONID={SDWAN_SESSION}; Path=/"})
+        if f"JSESSIONID={SDWAN_SESSION}" not in (self.headers.get("Cookie") or ""):
+            # セッション切れの vManage と同じくログインページを 200 で返す
+            return self.send_body(200, VMANAGE_LOGIN_PAGE, content_type="text/html")
+        if path == "/dataservice/device":
+            total = self.server.options["devices"]
+            return self.send_body(200, {"data": [sdwan_device(ctrl, i) for i in range(total)]})
+        return self.send_body(404, {"error": "Not found"})
+
+def serve_mock_controllers(options, port_queue):
+    """モックサーバーを起動し、待ち受けポートを port_queue に返す（別プロセスで実行）"""
+    random.seed(options["seed"])
+    server = ThreadingHTTPServer(("127.0.0.1", 0), MockControllerHandler)
+    server.daemon_threads = True
+    server.options = options
+    port_queue.put(server.server_address[1])
+    server.serve_forever()
+
+def build_config(base_url, domains, controllers, rate_limit=None):
+    """モックサーバーを指す config.yaml 相当の設定を作る"""
+    config = {"ACI": [], "MERAKI": [], "CATALYST": [], "SDWAN": []}
+    for i in range(controllers):
+        if "ACI" in domains:
+            config["ACI"].append({"name": f"aci{i}", "host": f"{base_url}/aci{i}", "user": "admin", "pass": "bench"})
+        if "MERAKI" in domains:
+            config["MERAKI"].append({"name": f"meraki{i}", "key": "bench", "org_id": str(i),
+                                     "base_url": f"{base_url}/meraki{i}/api/v1"})
+        if "CATALYST" in domains:
+            config["CATALYST"].append({"name": f"catalyst{i}", "host": f"{base_url}/catalyst{i}",
+                                       "user": "admin", "pass": "bench"})
+        if "SDWAN" in domains:
+            config["SDWAN"].append({"name": f"sdwan{i}", "url": f"{base_url}/sdwan{i}", "user": "admin", "pass": "bench"})
+    # スナップショットは計測対象外
+    settings = {"snapshot_path": ""}
+    if rate_limit:
+        settings["rate_limits"] = {kind: rate_limit for kind in core.DOMAINS}
+    config["SETTINGS"] = settings
+    return config
+
+# ==============================================================================
+# Benchmark Runner
+# 計測
+# ==============================================================================
+
+def _request_totals():
+    totals = {"requests": 0, "throttled": 0, "retried": 0, "failed": 0}
+    for counter in core.REQUEST_STATS.values():
+        for key in totals:
+            totals[key] += counter.get(key, 0)
+    return totals
+
+def run_round(label):
+    """全コントローラを1回取得し、所要時間・リクエスト数・取得台数を返す"""
+    gc.collect()
+    before = _request_totals()
+    start = time.perf_counter()
+    rows = core.get_all_inventory(force=True, allow_stale=False)
+    wall = time.perf_counter() - start
+    after = _request_totals()
+    errors = [r for r in rows if "error" in r]
+    result = {
+        "round": label,
+        "wall_s": round(wall, 4),
+        "devices": len(rows) - len(errors),
+        "errors": len(errors),
+        **{key: after[key] - before[key] for key in after},
+    }
+    result["devices_per_s"] = round(result["devices"] / wall, 1) if wall else None
+    result["requests_per_s"] = round(result["requests"] / wall, 1) if wall else None
+    return result, errors
+
+def run_benchmark(args):
+    domains = [DOMAIN_ARGS[d] for d in args.domains]
+    options = {
+        "devices": args.devices,
+        "latency": args.latency / 1000.0,
+        "error_rate": args.error_rate,
+        "throttle_rate": args.throttle_rate,
+        "retry_after": args.retry_after,
+        "seed": args.seed,
+    }
+    port_queue = multiprocessing.Queue()
+    server = multiprocessing.Process(target=serve_mock_controllers, args=(options, port_queue), daemon=True)
+    server.start()
+    try:
+        base_url = f"http://127.0.0.1:{port_queue.get(timeout=10)}"
+        core.set_config(build_config(base_url, domains, args.controllers, args.rate_limit))
+        core.INVENTORY_CACHE.clear()
+
+        rounds = []
+        sample_errors = []
+        for i in range(args.rounds):
+            # 1回目はログインを含む (cold)、2回目以降はセッション・接続を再利用 (warm)
+            result, errors = run_round("cold" if i == 0 else f"warm{i}")
+            rounds.append(result)
+            sample_errors = sample_errors or errors[:3]
+
+        memory = {}
+        if not args.no_memory:
+            tracemalloc.start()
+            core.get_all_inventory(force=True, allow_stale=False)
+            memory["peak_traced_mb"] = round(tracemalloc.get_traced_memory()[1] / 2**20, 1)
+            tracemalloc.stop()
+        if resource is not None:
+            rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            # Linux は KB、macOS は bytes
+            memory["max_rss_mb"] = round(rss / (2**20 if sys.platform == "darwin" else 2**10), 1)
+        core.close_sessions()
+    finally:
+        server.terminate()
+        server.join()
+
+    return {
+        "params": {
+            "domains": args.domains,
+            "controllers_per_domain": args.controllers,
+            "devices_per_controller": args.devices,
+            "expected_devices": len(domains) * args.controllers * args.devices,
+            **{k: v for k, v in options.items() if k != "devices"},
+            "rate_limit": args.rate_limit,
+        },
+        "rounds": rounds,
+        "memory": memory,
+        "sample_errors": sample_errors,
+    }
+
+def print_report(report):
+    params = report["params"]
+    print(f"Domains: {', '.join(params['domains'])} | "
+          f"{params['controllers_per_domain']} controllers x {params['devices_per_controller']} devices "
+          f"(expected {params['expected_devices']}) | latency {params['latency'] * 1000:.0f} ms, "
+          f"error {params['error_rate']:.0%}, 429 {params['throttle_rate']:.0%}")
+    header = f"{'ROUND':<8} {'WALL(s)':>9} {'DEVICES':>9} {'ERRORS':>7} {'REQS':>7} {'429':>5} {'RETRY':>6} {'DEV/s':>10} {'REQ/s':>8}"
+    print(header)
+    print("-" * len(header))
+    for r in report["rounds"]:
+        print(f"{r['round']:<8} {r['wall_s']:>9.3f} {r['devices']:>9} {r['errors']:>7} {r['requests']:>7} "
+              f"{r['throttled']:>5} {r['retried']:>6} {r['devices_per_s'] or 0:>10.1f} {r['requests_per_s'] or 0:>8.1f}")
+    for key, value in report["memory"].items():
+        print(f"{key}: {value}")
+    for err in report["sample_errors"]:
+        print(f"[Error] {err.get('controller')}: {err.get('error')}")
+
+# ==============================================================================
+# Startup Benchmark
+# 起動時間（import 時間）の計測。重いモジュールが起動時に読み込まれるようになったら検出する
+# ==============================================================================
+
+BASE_DIR = core.BASE_DIR
+# エントリポイント -> import 時間の予算 (ms)
+STARTUP_BUDGET_MS = {
+    "multidomain_inventory_core": 150,
+    "multidomain_inventory_cli": 200,
+    "multidomain_inventory_mcp": 1500,
+}
+# import 時点では読み込まれていてはいけないモジュール（設定の参照・最初の接続まで遅延する）
+# mcp パッケージ自体が httpx を使うため、MCP サーバーでは yaml だけを確認する
+DEFERRED_MODULES = {
+    "multidomain_inventory_core": ("httpx", "yaml"),
+    "multidomain_inventory_cli": ("httpx", "yaml"),
+    "multidomain_inventory_mcp": ("yaml",),
+}
+
+def measure_import(module):
+    """
+    新しいインタプリタで module を import し、-X importtime の累積時間 (ms)、
+    直接 import しているモジュールの内訳、読み込まれてしまった遅延対象モジュールを返す。
+    """
+    code = (f"import sys, {module}; "
+            f"print(','.join(m for m in {DEFERRED_MODULES.get(module, ())!r} if m in sys.modules))")
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                          cwd=BASE_DIR, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{proc.stderr.strip()}")
+    total_us, children, pending = None, {}, {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        try:
+            _, cumulative, name = line[len("import time:"):].split("|")
+            cumulative = int(cumulative)
+        except ValueError:
+            continue  # 見出し行
+        # 名前の前の空白はネストの深さ (1段ごとに2文字)
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        name = name.strip()
+        if depth == 1:
+            pending[name] = cumulative
+        elif depth == 0:
+            # 子モジュールは親より先に出力されるので、親の行が出た時点でまとめて確定する
+            if name == module:
+                total_us, children = cumulative, pending
+            pending = {}
+    if total_us is None:
+        raise RuntimeError(f"no importtime entry for {module}")
+    loaded = [m for m in proc.stdout.strip().split(",") if m]
+    return total_us / 1000.0, {k: v / 1000.0 for k, v in children.items()}, loaded
+
+def run_startup_benchmark(args):
+    results = []
+    for module, budget in STARTUP_BUDGET_MS.items():
+        budget = args.budget.get(module, budget)
+        samples, children, loaded = [], {}, []
+        for _ in range(args.repeats):
+            total, children, loaded = measure_import(module)
+            samples.append(total)
+        results.append({
+            "module": module,
+            "import_ms": round(statistics.median(samples), 1),
+            "min_ms": round(min(samples), 1),
+            "budget_ms": budget,
+            "top_imports": {k: round(v, 1) for k, v in sorted(children.items(), key=lambda kv: -kv[1])[:5]},
+            "deferred_loaded": loaded,
+        })
+    return {"repeats": args.repeats, "python": sys.version.split()[0], "modules": results}
+
+def startup_ok(result):
+    return result["import_ms"] <= result["budget_ms"] and not result["deferred_loaded"]
+
+def print_startup_report(report):
+    print(f"Python {report['python']} | median of {report['repeats']} cold imports (python -X importtime)")
+    header = f"{'MODULE':<30} {'IMPORT(ms)':>11} {'MIN(ms)':>9} {'BUDGET(ms)':>11}  RESULT"
+    print(header)
+    print("-" * len(header))
+    for r in report["modules"]:
+        print(f"{r['module']:<30} {r['import_ms']:>11.1f} {r['min_ms']:>9.1f} {r['budget_ms']:>11}  "
+              f"{'ok' if startup_ok(r) else 'OVER BUDGET'}")
+        print("    " + ", ".join(f"{k} {v:.1f}ms" for k, v in r["top_imports"].items()))
+        if r["deferred_loaded"]:
+            print(f"    [Error] loaded at import time (should be deferred): {', '.join(r['deferred_loaded'])}")
+
+def parse_budget(value):
+    module, _, ms = value.partition("=")
+    if module not in STARTUP_BUDGET_MS or not ms:
+        raise argparse.ArgumentTypeError(f"expected MODULE=MS with MODULE in {', '.join(STARTUP_BUDGET_MS)}")
+    return module, float(ms)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the inventory collection path against mock controllers")
+    parser.add_argument("--domains", nargs="+", choices=sorted(DOMAIN_ARGS), default=list(DOMAIN_ARGS),
+                        help="domains to include (default: all)")
+    parser.add_argument("--controllers", type=int, default=2, help="controllers per domain (default: 2)")
+    parser.add_argument("--devices", type=int, default=2000, help="devices per controller (default: 2000)")
+    parser.add_argument("--latency", type=float, default=10.0, help="server latency per request in ms (default: 10)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 503")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="fraction of requests answered with 429")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds sent with 429 (default: 1)")
+    parser.add_argument("--rate-limit", type=float, default=None,
+                        help="override per-controller requests/s for every domain (default: built-in limits)")
+    parser.add_argument("--rounds", type=int, default=3, help="timed collection rounds (default: 3)")
+    parser.add_argument("--seed", type=int, default=1, help="random seed for injected errors")
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc round")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    parser.add_argument("--startup", action="store_true",
+                        help="measure import time of the core / CLI / MCP entry points against their budgets")
+    parser.add_argument("--repeats", type=int, default=5, help="cold imports per module for --startup (default: 5)")
+    parser.add_argument("--budget", type=parse_budget, action="append", default=[], metavar="MODULE=MS",
+                        help="override the import budget of a module for --startup")
+    args = parser.parse_args(argv)
+    args.budget = dict(args.budget)
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.startup:
+        report = run_startup_benchmark(args)
+        if args.json:
+            print(json.dumps(report, indent=2, ensure_ascii=False))
+        else:
+            print_startup_report(report)
+        # 予算超過、または遅延させるべきモジュールが読み込まれていれば非0で終了する
+        return 0 if all(startup_ok(r) for r in report["modules"]) else 1
+    report = run_benchmark(args)
+    if args.json:
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+    else:
+        print_report(report)
+    # 想定台数に届かなかった場合（エラー・取りこぼし）は非0で終了する
+    return 0 if report["rounds"] and report["rounds"][-1]["devices"] == report["params"]["expected_devices"] else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,7 +4,13 @@
 
 import sys
 import time
-from multidomain_inventory_core import get_all_inventory
+import argparse
+import threading
+from datetime import datetime
+from multidomain_inventory_core import (
+    iter_inventory, list_controllers, load_snapshot, save_snapshot, get_timing_stats,
+    controller_name, diff_inventory, diff_snapshots, DOMAIN_LABELS
+)
 
 # --- カラー設定 (GUIのバッジ風にするため背景色を使用) ---
 class Colors:
@@ -15,6 +21,8 @@ class Colors:
     WHITE_TXT = '\033[97m'
     BLACK_TXT = '\033[30m'
     RED_TXT = '\033[91m'
+    GREEN_TXT = '\033[92m'
+    YELLOW_TXT = '\033[93m'
     GRAY_TXT = '\033[90m'
 
     # 背景色 (Badge Style)
@@ -33,15 +41,32 @@ def get_badge_color(domain):
     if "sdwan" in d:    return Colors.BG_PURPLE + Colors.WHITE_TXT
     return Colors.BG_DEFAULT + Colors.WHITE_TXT
 
-def main():
-    print(f"\n{Colors.BOLD}🚀 Starting Multi-Domain Inventory Collector (CLI)...{Colors.RESET}\n")
-    
-    start_time = time.time()
-    
-    # データの取得（並列処理）
-    print(f"{Colors.GRAY_TXT}Fetching data from all configured controllers...{Colors.RESET}")
-    data = get_all_inventory()
-    
+def snapshot_version(value):
+    """--from-snapshot の値: "latest" または正のスナップショット番号"""
+    if value == "latest":
+        return value
+    try:
+        version = int(value)
+    except ValueError:
+        version = 0
+    if version < 1:
+        raise argparse.ArgumentTypeError(f"expected 'latest' or a snapshot version number, got {value!r}")
+    return version
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Cisco Multi-Domain Inventory Collector (CLI)")
+    parser.add_argument("--from-snapshot", "--offline", dest="snapshot", nargs="?", const="latest",
+                        type=snapshot_version, metavar="VERSION",
+                        help="answer from the saved snapshot (latest, or VERSION) without contacting any controller")
+    parser.add_argument("--timings", action="store_true",
+                        help="print per-controller time spent in auth, HTTP, JSON decode and transform")
+    parser.add_argument("--watch", type=float, metavar="INTERVAL",
+                        help="re-collect every INTERVAL seconds and print only added/removed/changed devices")
+    parser.add_argument("--diff", type=int, metavar="VERSION",
+                        help="print the changes between snapshot VERSION and the latest snapshot")
+    return parser.parse_args(argv)
+
+def print_header():
     # --- ヘッダーの表示 ---
     # レイアウト: [DOMAINバッジ] [CONTROLLER名] [DEVICE NAME] ...
     # ANSIエスケープシーケンスがあるため、formatメソッドでの完全な位置合わせは難しい。
@@ -53,38 +78,210 @@ def main():
     print("-" * 150)
     print(Colors.BOLD + header_str + Colors.RESET)
     print("-" * 150)
+
+def print_row(row):
+    domain = row.get('domain', 'Unknown')
+    controller = row.get('controller', '-') # core側で追加したcontrollerフィールドを取得
     
-    for row in data:
-        domain = row.get('domain', 'Unknown')
-        controller = row.get('controller', '-') # core側で追加したcontrollerフィールドを取得
-        
-        # バッジ色の決定
-        badge_color = get_badge_color(domain)
-        
-        # ドメインバッジの作成 (10文字幅でセンタリング)
-        # 注意: 色コード自体は文字数に含まれないが、表示上のズレを防ぐためバッジ部分は独立してprintする
-        domain_str = f"{badge_color} {domain:^10} {Colors.RESET}"
-
-        # エラー行の処理
-        if "error" in row:
-            # エラー時もコントローラ名は表示して、どこが落ちているか分かるようにする
-            print(f"{domain_str} "
-                  f"{str(controller)[:17]:<18} "
-                  f"{Colors.RED_TXT}Error: {row['error']}{Colors.RESET}")
-            continue
-            
-        # 通常行の表示
+    # バッジ色の決定
+    badge_color = get_badge_color(domain)
+    
+    # ドメインバッジの作成 (10文字幅でセンタリング)
+    # 注意: 色コード自体は文字数に含まれないが、表示上のズレを防ぐためバッジ部分は独立してprintする
+    domain_str = f"{badge_color} {domain:^10} {Colors.RESET}"
+
+    # エラー行の処理
+    if "error" in row:
+        # エラー時もコントローラ名は表示して、どこが落ちているか分かるようにする
         print(f"{domain_str} "
-              f"{str(controller)[:17]:<18} " # コントローラ名（長すぎたらカット）
-              f"{str(row.get('name', ''))[:24]:<25} "
-              f"{str(row.get('model', ''))[:19]:<20} "
-              f"{str(row.get('serial', ''))[:17]:<18} "
-              f"{str(row.get('version', ''))[:14]:<15} "
-              f"{row.get('dashboard_url', '')}")
+              f"{str(controller)[:17]:<18} "
+              f"{Colors.RED_TXT}Error: {row['error']}{Colors.RESET}")
+        return
+        
+    # 通常行の表示
+    print(f"{domain_str} "
+          f"{str(controller)[:17]:<18} " # コントローラ名（長すぎたらカット）
+          f"{str(row.get('name', ''))[:24]:<25} "
+          f"{str(row.get('model', ''))[:19]:<20} "
+          f"{str(row.get('serial', ''))[:17]:<18} "
+          f"{str(row.get('version', ''))[:14]:<15} "
+          f"{row.get('dashboard_url', '')}")
+
+class Progress:
+    """
+    取得中のコントローラ数・完了数・失敗数・経過時間を stderr の1行に表示し続ける。
+    結果の行を出力する前に clear() で消し、出力後に再描画する（stderr が端末でなければ何もしない）。
+    """
+    INTERVAL = 0.2
+
+    def __init__(self, total):
+        self.total = total
+        self.done = 0
+        self.failed = 0
+        self.started = time.time()
+        self.enabled = sys.stderr.isatty()
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def __enter__(self):
+        if self.enabled:
+            self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop_event.set()
+        with self.lock:
+            self._clear()
+
+    def _run(self):
+        while not self.stop_event.wait(self.INTERVAL):
+            with self.lock:
+                self._draw()
+
+    def _clear(self):
+        if self.enabled:
+            sys.stderr.write("\r\033[K")
+            sys.stderr.flush()
+
+    def _draw(self):
+        if self.enabled and not self.stop_event.is_set():
+            pending = self.total - self.done
+            sys.stderr.write(f"\r\033[K{Colors.GRAY_TXT}⏳ {self.done}/{self.total} controllers done, "
+                             f"{pending} pending, {self.failed} failed "
+                             f"({time.time() - self.started:.1f}s){Colors.RESET}")
+            sys.stderr.flush()
+
+    def completed(self, rows):
+        """1コントローラ分の結果を、進捗行を消してから出力する"""
+        with self.lock:
+            self._clear()
+            self.done += 1
+            if rows and all("error" in r for r in rows):
+                self.failed += 1
+            for row in rows:
+                print_row(row)
+            sys.stdout.flush()
+            self._draw()
+
+def timestamp():
+    return f"{Colors.GRAY_TXT}{datetime.now().strftime('%H:%M:%S')}{Colors.RESET}"
+
+def print_delta(delta):
+    """diff_inventory の結果を +(追加) / -(削除) / ~(変更) の行として出力する"""
+    stamp = timestamp()
+    def label(row):
+        return f"{row.get('domain')}/{row.get('controller')} {row.get('name') or row.get('id')}"
+    for row in delta["added"]:
+        print(f"{stamp} {Colors.GREEN_TXT}+ {label(row)}{Colors.RESET} "
+              f"({row.get('model')}, {row.get('ip')}, {row.get('status')})")
+    for row in delta["removed"]:
+        print(f"{stamp} {Colors.RED_TXT}- {label(row)}{Colors.RESET}")
+    for _, row, changes in delta["changed"]:
+        detail = ", ".join(f"{f}: {before} -> {after}" for f, (before, after) in changes.items())
+        print(f"{stamp} {Colors.YELLOW_TXT}~ {label(row)}{Colors.RESET} {detail}")
+    sys.stdout.flush()
+
+def watch(interval):
+    """
+    interval 秒ごとに全コントローラを再取得し、前回からの差分だけを出力する（Ctrl+C で終了）。
+    取得に失敗したコントローラは前回の正常データを基準に残し、失敗/復旧の遷移だけを表示する。
+    """
+    baseline = {}  # (kind, controller) -> 前回の正常な行
+    failing = set()
+    first = True
+    try:
+        while True:
+            started = time.time()
+            for kind, site, rows in iter_inventory(force=True):
+                key = (kind, controller_name(site))
+                if rows and all("error" in r for r in rows):
+                    if key not in failing:
+                        failing.add(key)
+                        print(f"{timestamp()} {Colors.RED_TXT}! {DOMAIN_LABELS[kind]}/{key[1]} unreachable: "
+                              f"{rows[0]['error']}{Colors.RESET}")
+                    continue
+                if key in failing:
+                    failing.discard(key)
+                    print(f"{timestamp()} {Colors.GREEN_TXT}! {DOMAIN_LABELS[kind]}/{key[1]} recovered{Colors.RESET}")
+                previous = baseline.get(key)
+                baseline[key] = rows
+                if previous is not None and previous is not rows:
+                    print_delta(diff_inventory(previous, rows))
+            if first:
+                total = sum(len(rows) for rows in baseline.values())
+                print(f"{Colors.GRAY_TXT}Watching {total} devices on {len(baseline)} controllers "
+                      f"every {interval:g}s (Ctrl+C to stop)...{Colors.RESET}")
+                first = False
+            time.sleep(max(0.0, interval - (time.time() - started)))
+    except KeyboardInterrupt:
+        print()
+    return 0
+
+def main(argv=None):
+    args = parse_args(argv)
+    print(f"\n{Colors.BOLD}🚀 Starting Multi-Domain Inventory Collector (CLI)...{Colors.RESET}\n")
+    
+    start_time = time.time()
+    
+    if args.watch is not None:
+        return watch(args.watch)
+
+    if args.diff is not None:
+        try:
+            delta = diff_snapshots(args.diff)
+        except ValueError as e:
+            print(f"{Colors.RED_TXT}{e}{Colors.RESET}")
+            return 1
+        print_delta(delta)
+        print(f"{Colors.BOLD}📊 {len(delta['added'])} added, {len(delta['removed'])} removed, "
+              f"{len(delta['changed'])} changed{Colors.RESET}\n")
+        return 0
+
+    if args.snapshot:
+        # オフラインモード: ディスク上のスナップショットから表示（コントローラへは接続しない）
+        version = None if args.snapshot == "latest" else args.snapshot
+        data, (version, created_at) = load_snapshot(version)
+        if version is None:
+            print(f"{Colors.RED_TXT}No inventory snapshot found.{Colors.RESET}")
+            return 1
+        taken = datetime.fromtimestamp(created_at).strftime("%Y-%m-%d %H:%M:%S")
+        print(f"{Colors.GRAY_TXT}Loaded snapshot #{version} taken at {taken} (offline).{Colors.RESET}")
+        print_header()
+        for row in data:
+            print_row(row)
+        total = len(data)
+    else:
+        # データの取得（並列処理）。スナップショットやキャッシュは使わず、必ず各コントローラから取得する。
+        # 応答したコントローラから順に表示する
+        print(f"{Colors.GRAY_TXT}Fetching data from all configured controllers...{Colors.RESET}")
+        print_header()
+        total = 0
+        with Progress(len(list_controllers())) as progress:
+            for _, _, rows in iter_inventory(force=True):
+                progress.completed(rows)
+                total += len(rows)
+        save_snapshot()
               
     print("-" * 150)
-    print(f"{Colors.BOLD}📊 Total Devices: {len(data)}{Colors.RESET}")
+    print(f"{Colors.BOLD}📊 Total Devices: {total}{Colors.RESET}")
     print(f"✨ Completed in {time.time() - start_time:.2f} seconds.\n")
+    if args.timings and not args.snapshot:
+        print_timings()
+
+def print_timings():
+    """コントローラごとのフェーズ別所要時間（HTTP は各リクエストの合計、並列実行分も加算）"""
+    header = (f"{'CONTROLLER':<18} {'DOMAIN':<10} {'AUTH(s)':>8} {'HTTP(s)':>8} {'REQS':>5} "
+              f"{'KBYTES':>9} {'DECODE(s)':>10} {'TRANSFORM(s)':>13} {'TOTAL(s)':>9}")
+    print(Colors.BOLD + header + Colors.RESET)
+    print("-" * len(header))
+    for t in sorted(get_timing_stats().values(), key=lambda t: -t['phases']['total']['sum']):
+        p = t['phases']
+        print(f"{str(t['controller'])[:17]:<18} {t['domain']:<10} "
+              f"{p['auth']['sum']:>8.3f} {p['http']['sum']:>8.3f} {p['http']['count']:>5} "
+              f"{t['bytes'] / 1024:>9.1f} {p['decode']['sum']:>10.3f} {p['transform']['sum']:>13.3f} "
+              f"{p['total']['sum']:>9.3f}")
+    print()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
\ No newline at end of file
@@ -3,13 +3,24 @@
 # SPDX-License-Identifier: MIT
 
 import os
-import yaml
-import requests
-import urllib3
-from concurrent.futures import ThreadPoolExecutor
+import re
+import sys
+import json
+import time
+import sqlite3
+import random
+import asyncio
+import threading
+import concurrent.futures
+from array import array
+from bisect import bisect_left
+from itertools import accumulate
+from operator import attrgetter
+from collections import Counter, OrderedDict
+from collections.abc import Mapping
+# yaml / httpx / email.utils / ipaddress は起動を速くするため、初めて使う時に読み込む
+# （MCP サーバーや CLI は import 直後に応答できる必要がある）
 
-# SSL警告の抑止
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 TIMEOUT = 15
 
 # ==============================================================================
@@ -21,11 +32,19 @@ TIMEOUT = 15
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 CONFIG_PATH = os.path.join(BASE_DIR, "config.yaml")
 
+# config.yaml の更新を確認する間隔（秒）。確認は get_config() の呼び出し時に mtime を見るだけ
+CONFIG_CHECK_INTERVAL = 2.0
+
+def _read_config():
+    import yaml
+    with open(CONFIG_PATH, "r", encoding="utf-8") as f:
+        return yaml.safe_load(f) or {}
+
 def load_config():
     """config.yaml から設定を読み込む"""
+    import yaml
     try:
-        with open(CONFIG_PATH, "r", encoding="utf-8") as f:
-            return yaml.safe_load(f)
+        return _read_config()
     except FileNotFoundError:
         # ログにパスを出力してデバッグしやすくする
         print(f"[Error] Config file not found at: {CONFIG_PATH}")
@@ -35,25 +54,886 @@ def load_config():
         print(f"[Error] Failed to parse config.yaml: {e}")
         return {"ACI": [], "MERAKI": [], "CATALYST": [], "SDWAN": []}
 
-# グローバル設定として読み込み
-CONFIG = load_config()
+# 設定は最初に参照された時に読み込み、以降はファイルの更新を検知して丸ごと差し替える
+_CONFIG = None
+_CONFIG_STAMP = None    # 読み込んだ時点の config.yaml の (mtime_ns, size)
+_CONFIG_CHECKED = 0.0
+_CONFIG_WATCH = True    # set_config() で設定を直接与えた場合はファイルを監視しない
+_CONFIG_LOCK = threading.Lock()
+
+def _config_stamp():
+    try:
+        st = os.stat(CONFIG_PATH)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+def get_config():
+    """
+    現在の設定を返す。初回の呼び出しで config.yaml を読み込み、以降は CONFIG_CHECK_INTERVAL ごとに
+    mtime を確認して、変わっていれば読み直して差し替える（読み込みに失敗した場合は現在の設定を使い続ける）。
+    """
+    global _CONFIG, _CONFIG_STAMP, _CONFIG_CHECKED
+    config = _CONFIG
+    if config is not None and (not _CONFIG_WATCH or time.monotonic() - _CONFIG_CHECKED < CONFIG_CHECK_INTERVAL):
+        return config
+    with _CONFIG_LOCK:
+        if _CONFIG is None:
+            _CONFIG_STAMP = _config_stamp()
+            _CONFIG = load_config()
+        elif _CONFIG_WATCH and time.monotonic() - _CONFIG_CHECKED >= CONFIG_CHECK_INTERVAL:
+            stamp = _config_stamp()
+            if stamp is not None and stamp != _CONFIG_STAMP:
+                import yaml
+                _CONFIG_STAMP = stamp
+                try:
+                    _apply_config(_read_config())
+                except (OSError, yaml.YAMLError) as e:
+                    print(f"[Warning] Failed to reload config.yaml, keeping the current configuration: {e}",
+                          file=sys.stderr)
+        _CONFIG_CHECKED = time.monotonic()
+        return _CONFIG
 
-def get_proxies(proxy_url):
-    """プロキシURLが設定されている場合、requests用の辞書を返す"""
+def set_config(config):
+    """設定を直接与える（ベンチマーク等用）。以降 config.yaml は監視しない"""
+    global _CONFIG, _CONFIG_WATCH
+    with _CONFIG_LOCK:
+        _CONFIG_WATCH = False
+        if _CONFIG is None:
+            _CONFIG = config
+        else:
+            _apply_config(config)
+
+def __getattr__(name):
+    # 旧来の CONFIG 属性は、参照された時点の設定を返す
+    if name == "CONFIG":
+        return get_config()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def controller_url(host):
+    """host がスキーム付き (http:// / https://) ならそのまま、ホスト名だけなら https:// を付けたベースURLを返す"""
+    host = str(host).rstrip("/")
+    if host.startswith(("http://", "https://")):
+        return host
+    return f"https://{host}"
+
+def get_proxy(proxy_url):
+    """プロキシURLが設定されている場合はそのURLを、未設定なら None を返す"""
     if proxy_url and isinstance(proxy_url, str) and proxy_url.strip():
-        return {"http": proxy_url, "https": proxy_url}
+        return proxy_url.strip()
     return None
 
+# ==============================================================================
+# Collection Engine (asyncio + httpx)
+# 収集エンジン（全コントローラを1つのイベントループで並行取得）
+# ==============================================================================
+
+DOMAINS = ("ACI", "MERAKI", "CATALYST", "SDWAN")
+# 設定キー -> デバイス行の "domain" の値
+DOMAIN_LABELS = {"ACI": "ACI", "MERAKI": "Meraki", "CATALYST": "Catalyst", "SDWAN": "SDWAN"}
+DEVICE_FIELDS = ("id", "domain", "controller", "name", "status", "model", "serial", "version", "ip", "dashboard_url")
+# 異常とみなすステータス（小文字で比較。MCP のサマリー・異常一覧・ダッシュボードで共通）
+UNHEALTHY_STATUSES = frozenset({"offline", "unreachable", "error", "inactive", "alerting", "unknown"})
+
+def is_unhealthy(row):
+    """コントローラのエラー行、または異常ステータスのデバイス行なら True"""
+    return "error" in row or str(row.get("status", "")).lower() in UNHEALTHY_STATUSES
+
+def _intern(value):
+    return sys.intern(value) if type(value) is str else value
+
+_DEVICE_FIELD_SET = frozenset(DEVICE_FIELDS)
+
+class Device(Mapping):
+    """
+    1台分のデバイス情報（大規模環境向けの省メモリ表現）。
+    - __slots__ で dict を持たず、domain / controller / status / model / version は intern して全台で共有する
+    - dashboard_url はコントローラ単位の (prefix, field) から参照時に組み立てる
+      （field が None なら prefix そのもの、文字列を渡した場合はそのまま保持）
+    読み出しは従来の dict 行と同じ (row.get("name"), row["ip"], "error" in row)。
+    dict ではないため json.dumps には直接渡せない。row.to_dict() で従来と同じ形の dict に変換するか、
+    json.dumps(rows, default=json_default) を使う。
+    """
+    __slots__ = ("id", "domain", "controller", "name", "status", "model", "serial", "version", "ip", "link")
+
+    def __init__(self, id, domain, controller, name, status, model, serial, version, ip, dashboard_url=None):
+        self.id = id
+        self.domain = _intern(domain)
+        self.controller = _intern(controller)
+        self.name = name
+        self.status = _intern(status)
+        self.model = _intern(model)
+        self.serial = serial
+        self.version = _intern(version)
+        self.ip = ip
+        self.link = dashboard_url
+
+    @property
+    def dashboard_url(self):
+        link = self.link
+        if type(link) is not tuple:
+            return link
+        prefix, field = link
+        return prefix if field is None else f"{prefix}{getattr(self, field)}"
+
+    def __getitem__(self, key):
+        if key not in _DEVICE_FIELD_SET:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __contains__(self, key):
+        return key in _DEVICE_FIELD_SET
+
+    def __iter__(self):
+        return iter(DEVICE_FIELDS)
+
+    def __len__(self):
+        return len(DEVICE_FIELDS)
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in _DEVICE_FIELD_SET else default
+
+    def to_dict(self):
+        """従来の dict 行と同じ形の dict を返す"""
+        return {f: getattr(self, f) for f in DEVICE_FIELDS}
+
+    def __eq__(self, other):
+        # Mapping.__eq__ は dict に変換して比較するため、Device 同士は項目の値を直接比べる
+        # （link は保持の形が取得時とスナップショット読み込み時で異なるため、組み立てた dashboard_url で比べる）
+        if type(other) is Device:
+            return _device_values(self) == _device_values(other)
+        return Mapping.__eq__(self, other)
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"Device({dict(self)!r})"
+
+_device_values = attrgetter(*DEVICE_FIELDS)
+
+def json_default(obj):
+    """json.dumps(rows, default=json_default) で Device を含む行をそのまま JSON にするためのフック"""
+    if type(obj) is Device:
+        return obj.to_dict()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+# 同時に実行するHTTPリクエスト数の上限（config.yaml の SETTINGS で上書き可能）
+MAX_CONCURRENCY = 32
+DOMAIN_CONCURRENCY = {"ACI": 8, "MERAKI": 8, "CATALYST": 8, "SDWAN": 8}
+
+_ENGINE_LOOP = None
+_ENGINE_LOCK = threading.Lock()
+_LIMITS = {}
+
+def get_settings():
+    """config.yaml の SETTINGS セクションを返す（未定義なら空）"""
+    return (get_config() or {}).get("SETTINGS") or {}
+
+def _get_loop():
+    """収集エンジン専用のイベントループ（バックグラウンドスレッド）を返す"""
+    global _ENGINE_LOOP
+    with _ENGINE_LOCK:
+        if _ENGINE_LOOP is None:
+            _ENGINE_LOOP = asyncio.new_event_loop()
+            threading.Thread(target=_ENGINE_LOOP.run_forever, name="inventory-engine", daemon=True).start()
+        return _ENGINE_LOOP
+
+def run_sync(coro):
+    """
+    コルーチンをエンジンのイベントループで実行し、結果を同期的に返す。
+    接続プールをループに紐付けたまま再利用するため asyncio.run() は使わない。
+    """
+    return asyncio.run_coroutine_threadsafe(coro, _get_loop()).result()
+
+def _limit(kind):
+    """全体 (kind=None) またはドメイン単位の同時実行数セマフォを返す"""
+    if kind not in _LIMITS:
+        settings = get_settings()
+        if kind is None:
+            size = settings.get("max_concurrency", MAX_CONCURRENCY)
+        else:
+            size = (settings.get("domain_concurrency") or {}).get(kind, DOMAIN_CONCURRENCY.get(kind, MAX_CONCURRENCY))
+        _LIMITS[kind] = asyncio.Semaphore(max(1, int(size)))
+    return _LIMITS[kind]
+
+# ==============================================================================
+# Request Scheduler (Rate Limit / Retry-After)
+# リクエストスケジューラ（レート制限・Retry-After 対応・リトライ）
+# ==============================================================================
+
+# コントローラ/Org 単位の毎秒リクエスト数 (Meraki Dashboard API は Org あたり 10 req/s)
+RATE_LIMITS = {"ACI": 20, "MERAKI": 10, "CATALYST": 10, "SDWAN": 20}
+# 送信元単位の上限 (Meraki は送信元IPあたり 100 req/s、全Orgで共有)
+SOURCE_RATE_LIMITS = {"MERAKI": 100}
+RETRY_STATUSES = (429, 502, 503, 504)
+MAX_RETRIES = 4
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 30.0
+
+# (ドメイン, コントローラ名) -> Counter(requests, throttled, retried, failed)
+REQUEST_STATS = {}
+_SOURCE_BUCKETS = {}
+
+class TokenBucket:
+    """
+    asyncio 用のトークンバケット。待機は到着順に処理されるため、
+    同じ Org/コントローラへの同時リフレッシュも一定レートに均される。
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = max(float(rate), 0.001)
+        self.capacity = float(burst or max(1, rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds):
+        """Retry-After を受けたらバケットを一時停止し、後続リクエストも待たせる"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+def _rate_limit(kind, site_config):
+    """コントローラ単位のレート (site の rate_limit > SETTINGS.rate_limits > 既定値)"""
+    rate = site_config.get("rate_limit") or (get_settings().get("rate_limits") or {}).get(kind)
+    return float(rate or RATE_LIMITS.get(kind, 10))
+
+def _source_bucket(kind):
+    """ドメイン全体で共有する送信元単位のバケット（無ければ None）"""
+    if kind not in SOURCE_RATE_LIMITS:
+        return None
+    if kind not in _SOURCE_BUCKETS:
+        _SOURCE_BUCKETS[kind] = TokenBucket(SOURCE_RATE_LIMITS[kind])
+    return _SOURCE_BUCKETS[kind]
+
+def parse_retry_after(res):
+    """Retry-After ヘッダ（秒数 または HTTP-date）を秒数に変換する"""
+    value = res.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    from email.utils import parsedate_to_datetime
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def backoff_delay(attempt):
+    """指数バックオフ (full jitter)"""
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt)))
+
+def get_request_stats():
+    """コントローラごとのリクエスト数・スロットリング数・リトライ数を返す"""
+    return {f"{domain}/{name}": dict(stats) for (domain, name), stats in REQUEST_STATS.items()}
+
+# ==============================================================================
+# Timing Instrumentation
+# フェーズ別の所要時間計測（認証・HTTP・JSONデコード・変換・コントローラ全体）
+# ==============================================================================
+
+# ヒストグラムのバケット上限（秒、Prometheus の既定値に近いもの）
+TIMING_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# auth: ログイン/トークン更新, http: 個々のHTTPリクエスト (ログインを含む),
+# decode: JSONデコード, transform: デバイス行への変換, total: コントローラ1台分の取得全体
+TIMING_PHASES = ("auth", "http", "decode", "transform", "total")
+
+class Histogram:
+    """固定バケットのヒストグラム（観測数・合計・直近値）"""
+    __slots__ = ("counts", "count", "sum", "last")
+
+    def __init__(self):
+        self.counts = [0] * (len(TIMING_BUCKETS) + 1)  # 末尾は +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.last = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect_left(TIMING_BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        self.last = seconds
+
+    def buckets(self):
+        """(上限, 累積件数) のリスト（Prometheus の le と同じ意味）"""
+        return list(zip(TIMING_BUCKETS + (float("inf"),), accumulate(self.counts)))
+
+class ControllerTimings:
+    """コントローラ1台分のフェーズ別ヒストグラムと受信バイト数"""
+    __slots__ = ("phases", "bytes")
+
+    def __init__(self):
+        self.phases = {phase: Histogram() for phase in TIMING_PHASES}
+        self.bytes = 0
+
+    def observe(self, phase, seconds):
+        self.phases[phase].observe(seconds)
+
+# (ドメイン, コントローラ名) -> ControllerTimings
+TIMING_STATS = {}
+
+def controller_timings(domain, name):
+    return TIMING_STATS.setdefault((domain, name), ControllerTimings())
+
+def get_timing_stats():
+    """
+    コントローラごとのフェーズ別所要時間を返す。
+    {"domain/controller": {"domain", "controller", "bytes",
+                           "phases": {phase: {"count", "sum", "last", "buckets": [(le, 累積件数), ...]}}}}
+    """
+    result = {}
+    for (domain, name), timings in list(TIMING_STATS.items()):
+        result[f"{domain}/{name}"] = {
+            "domain": domain,
+            "controller": name,
+            "bytes": timings.bytes,
+            "phases": {
+                phase: {"count": h.count, "sum": h.sum, "last": h.last, "buckets": h.buckets()}
+                for phase, h in timings.phases.items()
+            },
+        }
+    return result
+
+# ==============================================================================
+# Session / Token Pool
+# コントローラ単位のセッション・トークンプール
+# ==============================================================================
+
+# 認証トークンの有効期間(秒)。期限より少し前にリフレッシュ/再ログインする
+TOKEN_REFRESH_MARGIN = 60
+ACI_TOKEN_TTL = 600       # aaaLogin の refreshTimeoutSeconds が無い場合の既定値
+CATALYST_TOKEN_TTL = 3600 # Catalyst Center のトークンは60分有効
+SDWAN_SESSION_TTL = 1800  # vManage の JSESSIONID はアイドル30分で失効
+
+class AuthError(Exception):
+    """コントローラへのログインに失敗した"""
+
+class ControllerSession:
+    """
+    コントローラ1台分の httpx.AsyncClient と認証状態を保持する。
+    Keep-Alive 接続とトークンを使い回し、期限前のリフレッシュと
+    401/403 時の透過的な再ログインを行う。
+    """
+    domain = None
+    kind = None
+    token_ttl = 0
+    verify = False
+
+    def __init__(self, site_config):
+        self.site_config = site_config
+        self.name = controller_name(site_config)
+        self.bucket = TokenBucket(_rate_limit(self.kind, site_config))
+        self.stats = REQUEST_STATS.setdefault((self.domain, self.name), Counter())
+        self.timings = controller_timings(self.domain, self.name)
+        # HTTP クライアントは最初のコントローラに接続する時点で読み込む
+        import httpx
+        self.client = httpx.AsyncClient(
+            verify=self.verify,
+            proxy=get_proxy(site_config.get("proxy")),
+            timeout=TIMEOUT,
+            follow_redirects=True,
+        )
+        self.lock = asyncio.Lock()
+        self.token = None
+        self.expires_at = 0
+
+    async def login(self):
+        """ログインしてトークンを取得する (サブクラスで実装)"""
+        self.token = True
+        return self.token_ttl
+
+    async def refresh(self):
+        """トークンを延長する。未対応のコントローラは再ログインする"""
+        return await self.login()
+
+    def invalidate(self):
+        self.token = None
+        self.expires_at = 0
+
+    async def ensure_auth(self):
+        """有効なトークンを保証する（期限切れならログイン、期限間近ならリフレッシュ）"""
+        async with self.lock:
+            now = time.time()
+            if self.token is not None and now < self.expires_at - TOKEN_REFRESH_MARGIN:
+                return
+            started = time.perf_counter()
+            ttl = None
+            if self.token is not None and now < self.expires_at:
+                try:
+                    ttl = await self.refresh()
+                except Exception:
+                    self.token = None
+            if ttl is None:
+                ttl = await self.login()
+            self.expires_at = time.time() + ttl
+            self.timings.observe("auth", time.perf_counter() - started)
+
+    def auth_failed(self, res):
+        """レスポンスが認証切れを示しているか"""
+        return res.status_code in (401, 403)
+
+    async def send(self, method, url, stream=False, **kwargs):
+        """
+        レート制限と同時実行数の上限内でリクエストを送信する。
+        429/5xx は Retry-After (無ければジッター付き指数バックオフ) に従って再送する。
+        stream=True の場合は本文を読まずに返す。同時実行数の枠は本文を読み終えるまで保持するので、
+        呼び出し側で必ず close_stream(res) すること。
+        """
+        source = _source_bucket(self.kind)
+        for attempt in range(MAX_RETRIES + 1):
+            await self.bucket.acquire()
+            if source is not None:
+                await source.acquire()
+            if stream:
+                res = await self._send_stream(method, url, **kwargs)
+            else:
+                async with _limit(self.kind), _limit(None):
+                    self.stats["requests"] += 1
+                    started = time.perf_counter()
+                    res = await self.client.request(method, url, **kwargs)
+                    self.timings.observe("http", time.perf_counter() - started)
+                    self.timings.bytes += res.num_bytes_downloaded
+            if res.status_code not in RETRY_STATUSES:
+                return res
+            if stream:
+                await close_stream(res)
+            if res.status_code == 429:
+                self.stats["throttled"] += 1
+            if attempt == MAX_RETRIES:
+                self.stats["failed"] += 1
+                return res
+            retry_after = parse_retry_after(res)
+            if retry_after is not None:
+                delay = retry_after + random.uniform(0, BACKOFF_BASE)
+            else:
+                delay = backoff_delay(attempt)
+            if res.status_code == 429:
+                self.bucket.pause(delay)
+            self.stats["retried"] += 1
+            await asyncio.sleep(delay)
+
+    async def _send_stream(self, method, url, **kwargs):
+        """ストリーミングで送信する。ドメイン/全体の同時実行数の枠は close_stream まで解放しない"""
+        limits = (_limit(self.kind), _limit(None))
+        for sem in limits:
+            await sem.acquire()
+        try:
+            self.stats["requests"] += 1
+            started = time.perf_counter()
+            res = await self.client.send(self.client.build_request(method, url, **kwargs), stream=True)
+        except BaseException:
+            for sem in limits:
+                sem.release()
+            raise
+        # 本文の受信時間とバイト数は読み終えた時点で iter_json が記録する
+        res.extensions["started"] = started
+        res.extensions["limits"] = limits
+        return res
+
+    async def request(self, method, url, **kwargs):
+        """認証付きでリクエストを送信し、認証切れの場合は一度だけ再ログインして再送する"""
+        await self.ensure_auth()
+        res = await self.send(method, url, **kwargs)
+        if self.auth_failed(res):
+            if kwargs.get("stream"):
+                await close_stream(res)
+            self.invalidate()
+            await self.ensure_auth()
+            res = await self.send(method, url, **kwargs)
+        return res
+
+    async def get(self, url, **kwargs):
+        return await self.request("GET", url, **kwargs)
+
+    def json(self, res):
+        """レスポンスをJSONとしてデコードする（デコード時間を記録）"""
+        started = time.perf_counter()
+        try:
+            return res.json()
+        finally:
+            self.timings.observe("decode", time.perf_counter() - started)
+
+    async def iter_json(self, url, key=None, extras=None, links=None, **kwargs):
+        """
+        GET した JSON の配列要素を、本文を受信しながら1件ずつ返す（全体をデコードしない）。
+        key=None ならトップレベルの配列、key を指定するとトップレベルのオブジェクト内の配列が対象。
+        extras には配列以外のメンバー (totalCount 等)、links には Link ヘッダの内容を入れる。
+        yield から戻るまでの時間（呼び出し側の変換処理）は transform として記録する。
+        """
+        res = await self.request("GET", url, stream=True, **kwargs)
+        parser = JsonItemStream(res.aiter_text(), key, extras)
+        transform = 0.0
+        try:
+            res.raise_for_status()
+            if links is not None:
+                links.update(res.links)
+            async for items in parser.batches():
+                started = time.perf_counter()
+                for item in items:
+                    yield item
+                transform += time.perf_counter() - started
+        finally:
+            await close_stream(res)
+            self.timings.observe("http", time.perf_counter() - res.extensions.get("started", time.perf_counter()))
+            self.timings.bytes += res.num_bytes_downloaded
+            self.timings.observe("decode", parser.decode_time)
+            self.timings.observe("transform", transform)
+
+async def close_stream(res):
+    """ストリーミングのレスポンスを閉じ、send で確保した同時実行数の枠を解放する（2回目以降は何もしない）"""
+    try:
+        await res.aclose()
+    finally:
+        for sem in res.extensions.pop("limits", ()):
+            sem.release()
+
+class AciSession(ControllerSession):
+    domain = "ACI"
+    kind = "ACI"
+    token_ttl = ACI_TOKEN_TTL
+
+    def _store_token(self, res):
+        res.raise_for_status()
+        attr = res.json()['imdata'][0]['aaaLogin']['attributes']
+        self.token = attr['token']
+        self.client.cookies.set('APIC-cookie', self.token)
+        return int(attr.get('refreshTimeoutSeconds') or self.token_ttl)
+
+    async def login(self):
+        base = controller_url(self.site_config.get("host"))
+        payload = {"aaaUser": {"attributes": {"name": self.site_config.get("user"), "pwd": self.site_config.get("pass")}}}
+        res = await self.send("POST", f"{base}/api/aaaLogin.json", json=payload)
+        if res.status_code in (401, 403):
+            raise AuthError(f"APIC login rejected ({res.status_code})")
+        return self._store_token(res)
+
+    async def refresh(self):
+        # aaaRefresh でトークンを延長（再ログイン不要）
+        base = controller_url(self.site_config.get("host"))
+        res = await self.send("GET", f"{base}/api/aaaRefresh.json")
+        return self._store_token(res)
+
+class CatalystSession(ControllerSession):
+    domain = "Catalyst"
+    kind = "CATALYST"
+    token_ttl = CATALYST_TOKEN_TTL
+
+    async def login(self):
+        base = controller_url(self.site_config.get("host"))
+        auth = (self.site_config.get("user"), self.site_config.get("pass"))
+        res = await self.send("POST", f"{base}/dna/system/api/v1/auth/token", auth=auth)
+        if res.status_code in (401, 403):
+            raise AuthError(f"Catalyst Center login rejected ({res.status_code})")
+        res.raise_for_status()
+        self.token = res.json()['Token']
+        self.client.headers["X-Auth-Token"] = self.token
+        return self.token_ttl
+
+class SdwanSession(ControllerSession):
+    domain = "SDWAN"
+    kind = "SDWAN"
+    token_ttl = SDWAN_SESSION_TTL
+
+    async def login(self):
+        url = self.site_config.get("url")
+        self.client.cookies.clear()
+        data = {'j_username': self.site_config.get("user"), 'j_password': self.site_config.get("pass")}
+        res = await self.send("POST", f"{url}/j_security_check", data=data)
+        # 認証失敗時、vManage は 200 でログインページ(HTML)を返す
+        if res.status_code in (401, 403) or "<html" in res.text[:512].lower():
+            raise AuthError("vManage login rejected")
+        self.token = self.client.cookies.get("JSESSIONID")
+        return self.token_ttl
+
+    def auth_failed(self, res):
+        # セッション失効時もログインページ(HTML)が 200 で返るため再ログインする
+        return super().auth_failed(res) or "text/html" in res.headers.get("Content-Type", "")
+
+class MerakiSession(ControllerSession):
+    domain = "Meraki"
+    kind = "MERAKI"
+    verify = True
+
+    def __init__(self, site_config):
+        super().__init__(site_config)
+        self.client.headers["X-Cisco-Meraki-API-Key"] = site_config.get("key")
+
+    async def login(self):
+        # APIキー方式のためログイン不要（接続の再利用のみ）
+        self.token = self.site_config.get("key")
+        return 365 * 24 * 3600
+
+_SESSION_CLASSES = {
+    "ACI": AciSession,
+    "MERAKI": MerakiSession,
+    "CATALYST": CatalystSession,
+    "SDWAN": SdwanSession,
+}
+_SESSION_POOL = {}
+_SESSION_POOL_LOCK = threading.Lock()
+
+def _site_fingerprint(site_config):
+    """接続情報が変わったらセッションを作り直すための識別子"""
+    return tuple(sorted((k, str(v)) for k, v in site_config.items()))
+
+def controller_name(site_config):
+    """設定からコントローラの表示名を決める"""
+    name = site_config.get("name") or site_config.get("host") or site_config.get("url") or site_config.get("org_id")
+    return str(name)
+
+def get_controller_session(kind, site_config):
+    """プールからコントローラ用セッションを取得（無ければ作成）。エンジンのループ内から呼ぶこと"""
+    key = (kind, controller_name(site_config))
+    fingerprint = _site_fingerprint(site_config)
+    with _SESSION_POOL_LOCK:
+        entry = _SESSION_POOL.get(key)
+        if entry is None or entry[0] != fingerprint:
+            if entry is not None:
+                asyncio.ensure_future(entry[1].client.aclose())
+            entry = (fingerprint, _SESSION_CLASSES[kind](site_config))
+            _SESSION_POOL[key] = entry
+        return entry[1]
+
+async def _close_sessions():
+    with _SESSION_POOL_LOCK:
+        sessions = [cs for _, cs in _SESSION_POOL.values()]
+        _SESSION_POOL.clear()
+    for cs in sessions:
+        await cs.client.aclose()
+
+def close_sessions():
+    """プール内の全セッションを破棄する"""
+    run_sync(_close_sessions())
+
+# ==============================================================================
+# Streaming JSON Decoder
+# レスポンス本文を受信しながら JSON 配列の要素を1件ずつデコードする
+# ==============================================================================
+
+_JSON_WS = re.compile(r"[ \t\n\r]*")
+_JSON_NUMBER_TAIL = re.compile(r"[0-9.eE+-]*")
+_JSON_DECODER = json.JSONDecoder()
+
+class JsonItemStream:
+    """
+    テキストのチャンク列から JSON 配列の要素を順にデコードするデコーダ。
+    チャンクが届くたびに、その時点で完結している要素をまとめて json の raw_decode でデコードし、
+    デコード済みの部分はバッファから捨てるため、本文全体やデコード後の木全体をメモリに保持しない。
+    key=None ならトップレベルの配列、key="imdata" 等ならトップレベルのオブジェクト内の配列を対象とし、
+    それ以外のメンバーは extras に格納する。
+    """
+
+    def __init__(self, chunks, key=None, extras=None):
+        self.chunks = chunks.__aiter__()
+        self.key = key
+        self.extras = {} if extras is None else extras
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+        self.after_item = False  # 配列内で要素の直後（次は , か ]）
+        self.decode_time = 0.0
+
+    async def _fill(self):
+        """次のチャンクをバッファに追加する（終端なら False）"""
+        if self.eof:
+            return False
+        try:
+            chunk = await self.chunks.__anext__()
+        except StopAsyncIteration:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    async def _peek(self):
+        """空白を読み飛ばして次の1文字を返す（終端なら ""）"""
+        while True:
+            self.pos = _JSON_WS.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf) or not await self._fill():
+                return self.buf[self.pos:self.pos + 1]
+
+    async def _expect(self, char):
+        if await self._peek() != char:
+            raise ValueError(f"Expected '{char}' in JSON stream, got {self.buf[self.pos:self.pos + 20]!r}")
+        self.pos += 1
+
+    def _decode(self, pos):
+        """pos から値を1つデコードする。バッファ内で完結していなければ None"""
+        try:
+            value, end = _JSON_DECODER.raw_decode(self.buf, pos)
+        except json.JSONDecodeError:
+            if self.eof:
+                raise
+            return None
+        if self._cut_number(value, end):
+            return None
+        return value, end
+
+    def _cut_number(self, value, end):
+        """
+        数値の後ろがバッファ末尾まで数値の続きになり得る文字だけなら、チャンクの切れ目で途切れた可能性がある
+        （"1." "6E" "-0." 等は json の scanner が手前までを完結した数値として返すため）
+        """
+        return (not self.eof and type(value) in (int, float)
+                and _JSON_NUMBER_TAIL.match(self.buf, end).end() >= len(self.buf))
+
+    async def _value(self):
+        """値を1つデコードする（必要なだけチャンクを読み足す）"""
+        await self._peek()
+        while True:
+            started = time.perf_counter()
+            decoded = self._decode(self.pos)
+            self.decode_time += time.perf_counter() - started
+            if decoded is not None:
+                value, self.pos = decoded
+                return value
+            await self._fill()
+
+    def _decode_batch(self):
+        """バッファ内で完結している配列要素をまとめてデコードする。(要素のリスト, 配列の終端に達したか)"""
+        buf, pos, items = self.buf, self.pos, []
+        size = len(buf)
+        scan = _JSON_DECODER.scan_once  # raw_decode の中身（C実装のスキャナ）を直接使う
+        while pos < size:
+            char = buf[pos]
+            if char in " \t\n\r":
+                pos = _JSON_WS.match(buf, pos).end()
+            elif self.after_item:
+                pos += 1
+                if char == "]":
+                    self.pos = pos
+                    return items, True
+                if char != ",":
+                    raise ValueError(f"Expected ',' or ']' in JSON array, got {char!r}")
+                self.after_item = False
+            else:
+                try:
+                    value, end = scan(buf, pos)
+                except StopIteration:
+                    if self.eof:
+                        raise json.JSONDecodeError("Expecting value", buf, pos) from None
+                    break
+                except json.JSONDecodeError:
+                    if self.eof:
+                        raise
+                    break
+                # チャンクの末尾で切れた数値は、続きが届くまで確定させない
+                if self._cut_number(value, end):
+                    break
+                items.append(value)
+                pos = end
+                self.after_item = True
+        self.pos = pos
+        return items, False
+
+    async def _array(self):
+        await self._expect("[")
+        if await self._peek() == "]":
+            self.pos += 1
+            return
+        self.after_item = False
+        while True:
+            started = time.perf_counter()
+            items, done = self._decode_batch()
+            self.decode_time += time.perf_counter() - started
+            if items:
+                yield items
+            if done:
+                return
+            if self.eof:
+                raise ValueError("Unexpected end of JSON stream")
+            await self._fill()
+
+    async def batches(self):
+        """対象配列の要素を、受信済みのチャンクで完結した分ずつリストで返す"""
+        if self.key is None:
+            async for items in self._array():
+                yield items
+            return
+        await self._expect("{")
+        if await self._peek() == "}":
+            return
+        while True:
+            name = await self._value()
+            await self._expect(":")
+            if name == self.key and await self._peek() == "[":
+                async for items in self._array():
+                    yield items
+            else:
+                self.extras[name] = await self._value()
+            sep = await self._peek()
+            self.pos += 1
+            if sep == "}":
+                return
+            if sep != ",":
+                raise ValueError(f"Expected ',' or '}}' in JSON object, got {sep!r}")
+
+# ==============================================================================
+# Pagination Helpers
+# ページング取得のヘルパー
+# ==============================================================================
+
+PAGE_WORKERS = 4           # 1コントローラあたりの同時ページ取得数
+ACI_PAGE_SIZE = 500        # fabricNode クエリの page-size
+CATALYST_PAGE_SIZE = 500   # network-device API の limit 上限
+MERAKI_PER_PAGE = 1000     # Dashboard API の perPage 上限
+MERAKI_API_URL = "https://api.meraki.com/api/v1"  # Org ごとに base_url で上書き可能
+
+async def fetch_pages(fetch_page, page_keys, map_page=None, workers=PAGE_WORKERS):
+    """
+    ページを最大 workers 並列で取得し、届いたページから順に map_page で変換する
+    （map_page=None なら fetch_page の戻り値をそのまま使う）。結果はページ順に連結して返す。
+    """
+    sem = asyncio.Semaphore(max(1, workers))
+
+    async def fetch_one(key):
+        async with sem:
+            return key, await fetch_page(key)
+
+    mapped = {}
+    for future in asyncio.as_completed([fetch_one(key) for key in page_keys]):
+        key, page = await future
+        mapped[key] = map_page(page) if map_page else page
+    results = []
+    for key in page_keys:
+        results.extend(mapped.get(key, []))
+    return results
+
+async def iter_meraki_items(session, url):
+    """Link: rel=next (RFC 5988) を辿って Meraki API の全ページの要素を受信しながら1件ずつ返す"""
+    params = {"perPage": MERAKI_PER_PAGE}
+    while url:
+        links = {}
+        async for item in session.iter_json(url, links=links, params=params):
+            yield item
+        # next のURLには perPage と startingAfter が含まれている
+        url = links.get("next", {}).get("url")
+        params = None
+
 # ==============================================================================
 # Domain Specific Fetch Logic (Single Site)
 # 各ドメインの単一サイト用取得ロジック
 # ==============================================================================
 
-def fetch_single_aci(site_config):
+async def fetch_single_aci_async(site_config):
     """単一のACIサイトからインベントリを取得"""
-    session = requests.Session()
-    session.verify = False
-    session.proxies.update(get_proxies(site_config.get("proxy")) or {})
     host = site_config.get("host")
     user = site_config.get("user")
     password = site_config.get("pass")
@@ -63,39 +943,45 @@ def fetch_single_aci(site_config):
         return []
 
     try:
-        # Login
-        url = f"https://{host}/api/aaaLogin.json"
-        payload = {"aaaUser": {"attributes": {"name": user, "pwd": password}}}
-        res = session.post(url, json=payload, timeout=TIMEOUT)
-        res.raise_for_status()
-        token = res.json()['imdata'][0]['aaaLogin']['attributes']['token']
-        
+        # Login はセッションプール側で必要な時だけ実行される
+        session = get_controller_session("ACI", site_config)
+
         # Get Data (Fabric Nodes)
-        res = session.get(f"https://{host}/api/node/class/fabricNode.json", cookies={'APIC-cookie': token}, timeout=TIMEOUT)
-        
-        results = []
-        for i in res.json().get('imdata', []):
-            attr = i['fabricNode']['attributes']
-            results.append({
-                "id": attr.get('dn'),
-                "domain": "ACI",
-                "controller": site_name,
-                "name": attr.get('name'),
-                "status": attr.get('fabricSt', 'unknown'),
-                "model": attr.get('model'),
-                "serial": attr.get('serial'),
-                "version": attr.get('version'),
-                "ip": attr.get('address'),
-                "dashboard_url": f"https://{host}/"
-            })
-        return results
+        # dn 順で安定させたページング。1ページ目の totalCount から残りのページ数を決めて並列取得
+        base = controller_url(host)
+        node_url = f"{base}/api/node/class/fabricNode.json"
+        link = (f"{base}/", None)
+
+        def to_device(item):
+            attr = item['fabricNode']['attributes']
+            return Device(
+                id=attr.get('dn'),
+                domain="ACI",
+                controller=site_name,
+                name=attr.get('name'),
+                status=attr.get('fabricSt', 'unknown'),
+                model=attr.get('model'),
+                serial=attr.get('serial'),
+                version=attr.get('version'),
+                ip=attr.get('address'),
+                dashboard_url=link
+            )
+
+        async def fetch_page(page, extras=None):
+            # imdata[] の要素を受信しながら1件ずつデバイス行に変換する
+            params = {"order-by": "fabricNode.dn", "page": page, "page-size": ACI_PAGE_SIZE}
+            return [to_device(i) async for i in session.iter_json(node_url, "imdata", extras, params=params)]
+
+        extras = {}
+        first = await fetch_page(0, extras)
+        total = int(extras.get('totalCount') or 0)
+        pages = list(range(1, -(-total // ACI_PAGE_SIZE)))
+        return first + await fetch_pages(fetch_page, pages)
     except Exception as e:
         return [{"domain": "ACI", "controller": site_name, "error": f"Connection failed: {str(e)}"}]
 
-def fetch_single_meraki(org_config):
+async def fetch_single_meraki_async(org_config):
     """単一のMeraki Orgからインベントリを取得"""
-    session = requests.Session()
-    session.proxies.update(get_proxies(org_config.get("proxy")) or {})
     api_key = org_config.get("key")
     org_id = str(org_config.get("org_id"))
     org_name = org_config.get("name", org_id)
@@ -103,50 +989,55 @@ def fetch_single_meraki(org_config):
     if not api_key or not org_id:
         return []
 
-    headers = {"X-Cisco-Meraki-API-Key": api_key}
-    
     try:
+        session = get_controller_session("MERAKI", org_config)
+
         # デバイス一覧とステータス一覧を並列で取得（効率化）
-        inventory_url = f"https://api.meraki.com/api/v1/organizations/{org_id}/devices"
-        status_url = f"https://api.meraki.com/api/v1/organizations/{org_id}/devices/statuses"
-        
-        with ThreadPoolExecutor(max_workers=2) as ex:
-            f_inv = ex.submit(session.get, inventory_url, headers=headers, timeout=TIMEOUT)
-            f_stat = ex.submit(session.get, status_url, headers=headers, timeout=TIMEOUT)
-            
-            inv_res = f_inv.result()
-            stat_res = f_stat.result()
-            
-        inv_res.raise_for_status()
-        stat_res.raise_for_status()
-        
-        # ステータスをマッピング (Serial -> Status)
-        status_map = {s['serial']: s.get('status') for s in stat_res.json()}
-        
+        api_url = str(org_config.get("base_url") or MERAKI_API_URL).rstrip("/")
+        inventory_url = f"{api_url}/organizations/{org_id}/devices"
+        status_url = f"{api_url}/organizations/{org_id}/devices/statuses"
+        link = (f"https://dashboard.meraki.com/o/{org_id}/manage/organization/inventory?search=", "serial")
+
+        # ステータスをマッピング (Serial -> Status)。ページが届くたびに追記する
+        status_map = {}
+
+        async def walk_statuses():
+            async for s in iter_meraki_items(session, status_url):
+                status_map[s['serial']] = s.get('status')
+
         results = []
-        for d in inv_res.json():
-            serial = d.get('serial')
-            results.append({
-                "id": serial,
-                "domain": "Meraki",
-                "controller": org_name,
-                "name": d.get('name') or serial,
-                "status": status_map.get(serial, "unknown"),
-                "model": d.get('model'),
-                "serial": serial,
-                "version": d.get('firmware'),
-                "ip": d.get('lanIp') or "Cloud Managed",
-                "dashboard_url": f"https://dashboard.meraki.com/o/{org_id}/manage/organization/inventory?search={serial}"
-            })
+        pending = []  # ステータスページがまだ届いていないデバイス
+        status_task = asyncio.ensure_future(walk_statuses())
+        try:
+            async for d in iter_meraki_items(session, inventory_url):
+                serial = d.get('serial')
+                row = Device(
+                    id=serial,
+                    domain="Meraki",
+                    controller=org_name,
+                    name=d.get('name') or serial,
+                    status=status_map.get(serial),
+                    model=d.get('model'),
+                    serial=serial,
+                    version=d.get('firmware'),
+                    ip=d.get('lanIp') or "Cloud Managed",
+                    dashboard_url=link
+                )
+                if row.status is None:
+                    pending.append(row)
+                results.append(row)
+            await status_task
+        finally:
+            status_task.cancel()
+
+        for row in pending:
+            row.status = _intern(status_map.get(row.serial) or "unknown")
         return results
     except Exception as e:
         return [{"domain": "Meraki", "controller": org_name, "error": f"Connection failed: {str(e)}"}]
 
-def fetch_single_catalyst(site_config):
+async def fetch_single_catalyst_async(site_config):
     """単一のCatalyst Centerからインベントリを取得"""
-    session = requests.Session()
-    session.verify = False
-    session.proxies.update(get_proxies(site_config.get("proxy")) or {})
     host = site_config.get("host")
     user = site_config.get("user")
     password = site_config.get("pass")
@@ -156,40 +1047,44 @@ def fetch_single_catalyst(site_config):
         return []
 
     try:
-        # Auth Token
-        auth_url = f"https://{host}/dna/system/api/v1/auth/token"
-        res = session.post(auth_url, auth=(user, password), timeout=TIMEOUT)
-        res.raise_for_status()
-        token = res.json()['Token']
-        
-        # Get Devices
-        dev_url = f"https://{host}/dna/intent/api/v1/network-device"
-        res = session.get(dev_url, headers={"X-Auth-Token": token}, timeout=TIMEOUT)
+        # Auth Token はプール内でキャッシュされ、期限切れ/401時のみ再取得
+        session = get_controller_session("CATALYST", site_config)
+
+        # 総台数を取得してからページ (offset は1始まり) を並列取得
+        base = controller_url(host)
+        dev_url = f"{base}/dna/intent/api/v1/network-device"
+        res = await session.get(f"{dev_url}/count")
         res.raise_for_status()
-        
-        results = []
-        for d in res.json().get('response', []):
-            results.append({
-                "id": d.get('id'),
-                "domain": "Catalyst",
-                "controller": site_name,
-                "name": d.get('hostname'),
-                "status": d.get('reachabilityStatus', 'unknown'),
-                "model": d.get('platformId'),
-                "serial": d.get('serialNumber'),
-                "version": d.get('softwareVersion'),
-                "ip": d.get('managementIpAddress'),
-                "dashboard_url": f"https://{host}/dna/assurance/device/details?id={d.get('id')}"
-            })
-        return results
+        total = int(session.json(res).get('response') or 0)
+        offsets = list(range(1, total + 1, CATALYST_PAGE_SIZE)) or [1]
+
+        link = (f"{base}/dna/assurance/device/details?id=", "id")
+
+        def to_device(d):
+            return Device(
+                id=d.get('id'),
+                domain="Catalyst",
+                controller=site_name,
+                name=d.get('hostname'),
+                status=d.get('reachabilityStatus', 'unknown'),
+                model=d.get('platformId'),
+                serial=d.get('serialNumber'),
+                version=d.get('softwareVersion'),
+                ip=d.get('managementIpAddress'),
+                dashboard_url=link
+            )
+
+        async def fetch_page(offset):
+            # response[] の要素を受信しながら1件ずつデバイス行に変換する
+            params = {"offset": offset, "limit": CATALYST_PAGE_SIZE}
+            return [to_device(d) async for d in session.iter_json(dev_url, "response", params=params)]
+
+        return await fetch_pages(fetch_page, offsets)
     except Exception as e:
         return [{"domain": "Catalyst", "controller": site_name, "error": f"Connection failed: {str(e)}"}]
 
-def fetch_single_sdwan(site_config):
+async def fetch_single_sdwan_async(site_config):
     """単一のSD-WAN vManageからインベントリを取得"""
-    session = requests.Session()
-    session.verify = False
-    session.proxies.update(get_proxies(site_config.get("proxy")) or {})
     url = site_config.get("url")
     user = site_config.get("user")
     password = site_config.get("pass")
@@ -199,87 +1094,1200 @@ def fetch_single_sdwan(site_config):
         return []
 
     try:
-        # Login (j_security_check)
-        login_url = f"{url}/j_security_check"
-        session.post(login_url, data={'j_username': user, 'j_password': password}, timeout=TIMEOUT)
-        
-        # Get Devices
+        # Login (j_security_check) は JSESSIONID が失効した時のみ実行
+        session = get_controller_session("SDWAN", site_config)
+
+        # Get Devices (data[] の要素を受信しながら1件ずつ変換)
         dev_url = f"{url}/dataservice/device"
-        res = session.get(dev_url, timeout=TIMEOUT)
-        res.raise_for_status()
-        
+        link = (f"{url}/#/app/monitor/network/system?deviceId=", "ip")
         results = []
-        for d in res.json().get('data', []):
-            results.append({
-                "id": d.get('uuid'),
-                "domain": "SDWAN",
-                "controller": site_name,
-                "name": d.get('host-name'),
-                "status": d.get('status', 'unknown'),
-                "model": d.get('device-model'),
-                "serial": d.get('uuid'),
-                "version": d.get('version'),
-                "ip": d.get('system-ip'),
-                "dashboard_url": f"{url}/#/app/monitor/network/system?deviceId={d.get('system-ip')}"
-            })
+        async for d in session.iter_json(dev_url, "data"):
+            results.append(Device(
+                id=d.get('uuid'),
+                domain="SDWAN",
+                controller=site_name,
+                name=d.get('host-name'),
+                status=d.get('status', 'unknown'),
+                model=d.get('device-model'),
+                serial=d.get('uuid'),
+                version=d.get('version'),
+                ip=d.get('system-ip'),
+                dashboard_url=link
+            ))
         return results
     except Exception as e:
         return [{"domain": "SDWAN", "controller": site_name, "error": f"Connection failed: {str(e)}"}]
 
+FETCHERS = {
+    "ACI": fetch_single_aci_async,
+    "MERAKI": fetch_single_meraki_async,
+    "CATALYST": fetch_single_catalyst_async,
+    "SDWAN": fetch_single_sdwan_async,
+}
+
+# 既存の同期APIとの互換用ラッパー
+def fetch_single_aci(site_config):
+    return run_sync(fetch_single_aci_async(site_config))
+
+def fetch_single_meraki(org_config):
+    return run_sync(fetch_single_meraki_async(org_config))
+
+def fetch_single_catalyst(site_config):
+    return run_sync(fetch_single_catalyst_async(site_config))
+
+def fetch_single_sdwan(site_config):
+    return run_sync(fetch_single_sdwan_async(site_config))
+
+# ==============================================================================
+# Snapshot Store (SQLite)
+# インベントリのスナップショット保存（ウォームスタート・オフライン参照用）
+# ==============================================================================
+
+SNAPSHOT_PATH = os.path.join(BASE_DIR, "inventory_snapshots.db") # SETTINGS.snapshot_path で変更 ("" で無効)
+SNAPSHOT_KEEP = 100 # 保持するスナップショット数（デバイス行が変わった時だけ版が増える）
+SNAPSHOT_MMAP_SIZE = 256 * 2**20 # 読み出しはメモリマップ経由（同じホストのプロセス間で OS のページを共有）
+
+class SnapshotStore:
+    """
+    get_all_inventory の結果をバージョン付きで SQLite に保存する。
+    デバイス行はコントローラごとのリビジョン (revisions / revision_devices) として保存し、
+    スナップショットは各コントローラのリビジョンと取得時刻の組 (snapshot_revisions) だけを持つ。
+    - 内容が変わらなかったコントローラは取得時刻だけを更新し、行は書き直さない
+    - どれかのコントローラの行が変わった時だけ新しいバージョンを作り、変わらないコントローラのリビジョンは共有する
+    複数プロセスで共有する場合は、コントローラ単位の取得リース (leases) で再取得を1プロセスに限定する。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._ready = False
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute(f"PRAGMA mmap_size={SNAPSHOT_MMAP_SIZE}")
+        if not self._ready:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS snapshots (
+                    version INTEGER PRIMARY KEY AUTOINCREMENT,
+                    created_at REAL NOT NULL,
+                    device_count INTEGER NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS revisions (
+                    rev INTEGER PRIMARY KEY AUTOINCREMENT,
+                    kind TEXT NOT NULL,
+                    controller TEXT NOT NULL,
+                    device_count INTEGER NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS revision_devices (
+                    rev INTEGER NOT NULL,
+                    domain TEXT NOT NULL,
+                    controller TEXT NOT NULL,
+                    id TEXT,
+                    name TEXT, status TEXT, model TEXT, serial TEXT,
+                    version TEXT, ip TEXT, dashboard_url TEXT, error TEXT
+                );
+                -- 行は rowid（取得した順）で保持する。id が無い・重複するデバイスも落とさない
+                CREATE INDEX IF NOT EXISTS revision_devices_rev ON revision_devices (rev);
+                CREATE TABLE IF NOT EXISTS snapshot_revisions (
+                    snapshot INTEGER NOT NULL,
+                    kind TEXT NOT NULL,
+                    controller TEXT NOT NULL,
+                    rev INTEGER NOT NULL,
+                    fetched_at REAL NOT NULL,
+                    PRIMARY KEY (snapshot, kind, controller)
+                );
+                CREATE INDEX IF NOT EXISTS snapshot_revisions_rev ON snapshot_revisions (rev);
+                CREATE TABLE IF NOT EXISTS store_meta (
+                    key TEXT PRIMARY KEY,
+                    value INTEGER NOT NULL
+                );
+                INSERT OR IGNORE INTO store_meta VALUES ('generation', 0);
+                CREATE TABLE IF NOT EXISTS leases (
+                    kind TEXT NOT NULL,
+                    controller TEXT NOT NULL,
+                    owner TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    PRIMARY KEY (kind, controller)
+                );
+            """)
+            self._ready = True
+        return conn
+
+    def save(self, controllers, configured=()):
+        """
+        controllers: {(kind, controller): (fetched_at, rows, rev)} を保存し、
+        (最新バージョン, {(kind, controller): rows を保存した（参照させた）リビジョン}) を返す。
+        rev は rows と同じ内容の保存済みリビジョン（不明・変更ありなら None）。リビジョンが残っていれば
+        行は書かずにそれを参照し、最新版と同じリビジョンなら取得時刻だけを更新する（新しい版は作らない）。
+        最新のスナップショットに同じコントローラのより新しい（または同じ）データがあれば、そちらを引き継ぐ
+        （他のプロセスが保存した新しいデータを古いデータで上書きしない）。
+        controllers に無くても configured に含まれるコントローラは最新のスナップショットから引き継ぐ。
+        """
+        conn = self._connect()
+        try:
+            with conn:
+                # 保存は書き込みロックを取ってから最新版を確認する（プロセス間で直列化）
+                conn.execute("BEGIN IMMEDIATE")
+                latest = conn.execute("SELECT MAX(version) FROM snapshots").fetchone()[0]
+                stored = self._snapshot_revisions(conn, latest) if latest is not None else {}
+                mapping = {key: stored[key] for key in stored if key in configured and key not in controllers}
+                saved = {}
+                for (kind, name), (fetched_at, data, rev) in controllers.items():
+                    current = stored.get((kind, name))
+                    if current is not None and current[1] >= fetched_at:
+                        mapping[(kind, name)] = current
+                        continue
+                    if rev is None or conn.execute("SELECT 1 FROM revisions WHERE rev = ?", (rev,)).fetchone() is None:
+                        rev = self._insert_revision(conn, kind, name, data)
+                    mapping[(kind, name)] = (rev, fetched_at)
+                    saved[(kind, name)] = rev
+                if latest is not None and {k: r for k, (r, _) in mapping.items()} == {k: r for k, (r, _) in stored.items()}:
+                    # 行はどのコントローラも変わっていない: 最新版の取得時刻だけを更新する
+                    conn.executemany(
+                        "UPDATE snapshot_revisions SET fetched_at = ? WHERE snapshot = ? AND kind = ? AND controller = ?",
+                        [(fetched_at, latest, kind, name) for (kind, name), (_, fetched_at) in mapping.items()
+                         if fetched_at != stored[(kind, name)][1]])
+                    version = latest
+                else:
+                    version = conn.execute("INSERT INTO snapshots (created_at, device_count) VALUES (?, 0)",
+                                           (time.time(),)).lastrowid
+                    conn.executemany("INSERT INTO snapshot_revisions VALUES (?, ?, ?, ?, ?)",
+                                     [(version, kind, name, rev, fetched_at)
+                                      for (kind, name), (rev, fetched_at) in mapping.items()])
+                    conn.execute("UPDATE snapshots SET device_count = (SELECT COALESCE(SUM(r.device_count), 0) "
+                                 "FROM snapshot_revisions s JOIN revisions r ON r.rev = s.rev WHERE s.snapshot = ?) "
+                                 "WHERE version = ?", (version, version))
+                    self._prune(conn, version)
+                conn.execute("UPDATE store_meta SET value = value + 1 WHERE key = 'generation'")
+            return version, saved
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _insert_revision(conn, kind, name, data):
+        rev = conn.execute("INSERT INTO revisions (kind, controller, device_count) VALUES (?, ?, 0)",
+                           (kind, name)).lastrowid
+        conn.executemany(
+            "INSERT INTO revision_devices VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [(rev,
+              row.get("domain") or DOMAIN_LABELS[kind],
+              row.get("controller") or name,
+              row.get("id"),
+              row.get("name"), row.get("status"), row.get("model"), row.get("serial"),
+              row.get("version"), row.get("ip"), row.get("dashboard_url"), row.get("error"))
+             for row in data])
+        conn.execute("UPDATE revisions SET device_count = "
+                     "(SELECT COUNT(*) FROM revision_devices WHERE rev = ?) WHERE rev = ?", (rev, rev))
+        return rev
+
+    @staticmethod
+    def _snapshot_revisions(conn, version):
+        """スナップショットの {(kind, controller): (rev, fetched_at)}（保存順）"""
+        return {(kind, name): (rev, fetched_at) for kind, name, rev, fetched_at in conn.execute(
+            "SELECT kind, controller, rev, fetched_at FROM snapshot_revisions WHERE snapshot = ? ORDER BY rowid",
+            (version,))}
+
+    def _prune(self, conn, version):
+        oldest = version - SNAPSHOT_KEEP
+        conn.execute("DELETE FROM snapshot_revisions WHERE snapshot <= ?", (oldest,))
+        conn.execute("DELETE FROM snapshots WHERE version <= ?", (oldest,))
+        # どのスナップショットからも参照されなくなったリビジョンの行を削除する
+        dead = conn.execute("SELECT rev FROM revisions WHERE NOT EXISTS "
+                            "(SELECT 1 FROM snapshot_revisions s WHERE s.rev = revisions.rev)").fetchall()
+        conn.executemany("DELETE FROM revision_devices WHERE rev = ?", dead)
+        conn.executemany("DELETE FROM revisions WHERE rev = ?", dead)
+
+    def latest_version(self):
+        """最新のスナップショット番号（無ければ None）"""
+        if not os.path.exists(self.path):
+            return None
+        conn = self._connect()
+        try:
+            return conn.execute("SELECT MAX(version) FROM snapshots").fetchone()[0]
+        finally:
+            conn.close()
+
+    def load(self, version=None):
+        """
+        スナップショットを読み込み {(kind, controller): (fetched_at, rows, rev)} と
+        (version, created_at) を返す。存在しない場合は ({}, (None, None))
+        """
+        if version is None:
+            version = self.latest_version()
+        if version is None:
+            return {}, (None, None)
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute("BEGIN")
+                meta = conn.execute("SELECT version, created_at FROM snapshots WHERE version = ?", (version,)).fetchone()
+                if meta is None:
+                    return {}, (None, None)
+                links = {}
+                controllers = {key: (fetched_at, self._read_revision(conn, rev, links), rev)
+                               for key, (rev, fetched_at) in self._snapshot_revisions(conn, version).items()}
+            return controllers, meta
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _read_revision(conn, rev, links):
+        """リビジョンのデバイス行を Device に戻して返す"""
+        rows = []
+        for domain, controller, dev_id, *values, error in conn.execute(
+                "SELECT domain, controller, id, name, status, model, serial, version, ip, dashboard_url, error "
+                "FROM revision_devices WHERE rev = ? ORDER BY rowid", (rev,)):
+            if error is not None:
+                rows.append({"domain": domain, "controller": controller, "error": error})
+            else:
+                rows.append(Device(dev_id, domain, controller, *values[:-1], _compact_link(links, dev_id, values)))
+        return rows
+
+    def load_newer(self, since_generation, known, only):
+        """
+        since_generation 以降に保存があれば、最新版で known {(kind, controller): (fetched_at, rev)}
+        より新しく取得されたコントローラ（only に含まれるもの）だけを読み込む。
+        known と同じリビジョンのコントローラは行を読まず rows を None で返す（取得時刻だけが進んだもの）。
+        戻り値: (世代番号, {(kind, controller): (fetched_at, rows, rev)})。変化が無ければ (since_generation, {})
+        """
+        if not os.path.exists(self.path):
+            return since_generation, {}
+        conn = self._connect()
+        try:
+            # 読み取りトランザクション内で版の確認と読み込みを行い、途中で保存・削除されても一貫させる
+            with conn:
+                conn.execute("BEGIN")
+                generation = conn.execute("SELECT value FROM store_meta WHERE key = 'generation'").fetchone()[0]
+                latest = conn.execute("SELECT MAX(version) FROM snapshots").fetchone()[0]
+                if latest is None or generation == since_generation:
+                    return generation, {}
+                links = {}
+                changed = {}
+                for key, (rev, fetched_at) in self._snapshot_revisions(conn, latest).items():
+                    known_at, known_rev = known.get(key, (0.0, None))
+                    if key in only and fetched_at > known_at:
+                        rows = None if rev == known_rev else self._read_revision(conn, rev, links)
+                        changed[key] = (fetched_at, rows, rev)
+            return generation, changed
+        finally:
+            conn.close()
+
+    def acquire_lease(self, key, owner, ttl):
+        """コントローラ key の取得リースを owner が取る（他のプロセスが有効なリースを持っていれば False）"""
+        now = time.time()
+        conn = self._connect()
+        try:
+            with conn:
+                cur = conn.execute(
+                    "INSERT INTO leases VALUES (?, ?, ?, ?) ON CONFLICT (kind, controller) DO UPDATE "
+                    "SET owner = excluded.owner, expires_at = excluded.expires_at "
+                    "WHERE leases.expires_at < ? OR leases.owner = excluded.owner",
+                    (key[0], key[1], owner, now + ttl, now))
+                return cur.rowcount == 1
+        finally:
+            conn.close()
+
+    def release_lease(self, key, owner):
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute("DELETE FROM leases WHERE kind = ? AND controller = ? AND owner = ?",
+                             (key[0], key[1], owner))
+        finally:
+            conn.close()
+
+def _compact_link(links, dev_id, values):
+    """
+    保存済みの dashboard_url を、serial / id / ip を末尾に持つ共有 prefix の (prefix, field) に戻す
+    （組み立て結果は元の文字列と必ず一致する。該当しなければ intern した文字列のまま）
+    """
+    name, status, model, serial, version, ip, url = values
+    if not url:
+        return url
+    for field, value in (("serial", serial), ("id", dev_id), ("ip", ip)):
+        if value is None:
+            continue
+        value = str(value)
+        if value and url.endswith(value):
+            key = (url[:-len(value)], field)
+            return links.setdefault(key, key)
+    return _intern(url)
+
+SNAPSHOT_STORE = None
+
+def get_snapshot_store():
+    """設定に従ったスナップショットストア（無効なら None）"""
+    global SNAPSHOT_STORE
+    path = get_settings().get("snapshot_path", SNAPSHOT_PATH)
+    if not path:
+        return None
+    path = os.path.join(BASE_DIR, path)
+    if SNAPSHOT_STORE is None or SNAPSHOT_STORE.path != path:
+        SNAPSHOT_STORE = SnapshotStore(path)
+    return SNAPSHOT_STORE
+
+def load_snapshot(version=None):
+    """保存済みスナップショットをデバイス行のリストとして返す（コントローラへは接続しない）"""
+    store = get_snapshot_store()
+    if store is None:
+        return [], (None, None)
+    controllers, meta = store.load(version)
+    rows = []
+    for _, data, _ in controllers.values():
+        rows.extend(data)
+    return rows, meta
+
+# ==============================================================================
+# Inventory Diff
+# 2つのインベントリ（スナップショット）の差分
+# ==============================================================================
+
+# 変更として報告するフィールド
+DIFF_FIELDS = ("status", "version", "ip")
+
+def device_key(row):
+    """デバイスを一意に識別するキー (domain, controller, id)"""
+    return (row.get("domain"), row.get("controller"), row.get("id"))
+
+def diff_inventory(old_rows, new_rows, fields=DIFF_FIELDS):
+    """
+    2つのデバイス一覧を (domain, controller, id) をキーに比較する（行数に比例する時間で完了）。
+    どちらかで取得に失敗している (error 行しかない) コントローラは、全台が追加/削除に見えないよう比較対象から外す。
+    戻り値: {"added": [新しい行], "removed": [古い行],
+             "changed": [(古い行, 新しい行, {field: (旧値, 新値)})], "skipped": [(domain, controller)]}
+    """
+    skipped = {(r.get("domain"), r.get("controller")) for rows in (old_rows, new_rows) for r in rows if "error" in r}
+    old = {}
+    for row in old_rows:
+        if "error" not in row and (row.get("domain"), row.get("controller")) not in skipped:
+            old[device_key(row)] = row
+    added, changed = [], []
+    for row in new_rows:
+        if "error" in row or (row.get("domain"), row.get("controller")) in skipped:
+            continue
+        before = old.pop(device_key(row), None)
+        if before is None:
+            added.append(row)
+        elif before is not row:
+            changes = {f: (before.get(f), row.get(f)) for f in fields if before.get(f) != row.get(f)}
+            if changes:
+                changed.append((before, row, changes))
+    return {"added": added, "removed": list(old.values()), "changed": changed, "skipped": sorted(skipped, key=str)}
+
+def diff_snapshots(old_version, new_version=None):
+    """保存済みスナップショット old_version と new_version（省略時は最新）の差分を返す"""
+    old_rows, (old_found, _) = load_snapshot(old_version)
+    new_rows, (new_found, _) = load_snapshot(new_version)
+    if old_found is None or new_found is None:
+        raise ValueError(f"Snapshot not found: {old_version if old_found is None else new_version}")
+    return diff_inventory(old_rows, new_rows)
+
+# ==============================================================================
+# Inventory Cache (Single-flight / Stale-While-Revalidate)
+# コントローラ単位の共有キャッシュ（CLI / Web / MCP 共通）
+# ==============================================================================
+
+CACHE_TTL = 300 # 5分間はキャッシュを使う（SETTINGS.cache_ttl / 各サイトの cache_ttl で上書き可能）
+# SETTINGS.shared_cache: true の場合、同じスナップショットDBを使う複数プロセス（Web のワーカー等）で取得結果を共有する
+SHARED_SYNC_INTERVAL = 2.0  # 他のプロセスが保存した新しいデータを確認する間隔（秒）
+SHARED_POLL_INTERVAL = 1.0  # 他のプロセスが取得中のコントローラの完了を待つ間隔（秒）
+SHARED_LEASE_TTL = 300      # 取得リースの有効期限（秒）。取得したプロセスが落ちてもこの時間で失効する
+_LEASE_TOKEN = format(random.getrandbits(32), "08x")
+
+def _lease_owner():
+    # fork したワーカーでも区別できるよう、呼び出し時の pid を含める
+    return f"{os.getpid()}:{_LEASE_TOKEN}"
+
+class CacheEntry:
+    """1コントローラ分のキャッシュデータと取得中タスク"""
+    __slots__ = ("data", "fetched_at", "task", "error", "failed_at", "rev")
+
+    def __init__(self):
+        self.data = None
+        self.fetched_at = 0.0  # 最後に正常に取得できた時刻
+        self.rev = None        # data と同じ内容の保存済みリビジョン（未保存なら None）
+        self.task = None
+        self.error = None      # 直近の取得が失敗した場合のエラー
+        self.failed_at = 0.0
+
+    @property
+    def checked_at(self):
+        """最後に取得を試みた時刻（失敗時の再試行間隔にも TTL を使う）"""
+        return max(self.fetched_at, self.failed_at)
+
+def _is_error_only(rows):
+    return bool(rows) and all("error" in r for r in rows)
+
+class InventoryAggregates:
+    """
+    インベントリ全体の集計値（ドメイン・コントローラ・ステータス・モデル・バージョン別の台数）。
+    コントローラのデータが差し替わるたびに、そのコントローラ分の集計だけを入れ替える。
+    読み出し側は summary（差し替え時に作り直す不変の dict）を参照するだけで済む。
+    """
+    FIELDS = ("domain", "controller", "status", "model", "version")
+
+    def __init__(self):
+        self.parts = {}   # (kind, controller) -> そのコントローラ分の集計
+        self.devices = 0
+        self.errors = 0
+        self.unhealthy = 0
+        self.counts = {f: Counter() for f in self.FIELDS}
+        self.summary = self._summarize()
+
+    @classmethod
+    def _tally(cls, rows):
+        counts = {f: Counter() for f in cls.FIELDS}
+        devices = errors = unhealthy = 0
+        for row in rows:
+            if "error" in row:
+                errors += 1
+                continue
+            devices += 1
+            if str(row.get("status", "")).lower() in UNHEALTHY_STATUSES:
+                unhealthy += 1
+            for f in cls.FIELDS:
+                counts[f][str(row.get(f) or "Unknown")] += 1
+        return devices, errors, unhealthy, counts
+
+    def _apply(self, part, sign):
+        devices, errors, unhealthy, counts = part
+        self.devices += sign * devices
+        self.errors += sign * errors
+        self.unhealthy += sign * unhealthy
+        for f, counter in counts.items():
+            total = self.counts[f]
+            for value, n in counter.items():
+                n = total[value] + sign * n
+                if n:
+                    total[value] = n
+                else:
+                    del total[value]
+
+    def _summarize(self):
+        return {
+            "total_devices": self.devices,
+            "controller_errors": self.errors,
+            "unhealthy_devices": self.unhealthy,
+            "health_issues": self.unhealthy + self.errors,
+            **{f"by_{f}": dict(self.counts[f]) for f in self.FIELDS},
+        }
+
+    def replace(self, key, rows):
+        """key のコントローラの集計を rows の内容で置き換える（rows=None なら削除）"""
+        old = self.parts.pop(key, None)
+        if old is not None:
+            self._apply(old, -1)
+        if rows is not None:
+            part = self.parts[key] = self._tally(rows)
+            self._apply(part, 1)
+        self.summary = self._summarize()
+
+    def clear(self):
+        self.__init__()
+
+class InventoryCache:
+    """
+    コントローラ単位のインベントリキャッシュ。
+    - 同じコントローラへの同時ロードは1回のフェッチに集約する (single-flight)
+    - TTL 切れのデータはそのまま返し、裏で再取得する (stale-while-revalidate)
+    - shared_cache が有効なら、コントローラごとに1プロセスだけが取得し、他のプロセスは
+      スナップショットDBから変わったコントローラの分だけを読み込む
+    すべての操作はエンジンのイベントループ上で実行される。
+    """
+
+    def __init__(self):
+        self.entries = {}
+        self.warm = None      # スナップショットからのウォームスタート用タスク
+        self.dirty = False    # 最後のスナップショット保存以降に更新があったか
+        self.save_lock = None
+        self.version = 0      # いずれかのコントローラのデバイス行が変わるたびに増える
+        self.updated_at = 0.0 # 最後にデバイス行が変わった時刻
+        self.state_version = 0 # 取得の完了・失敗（fetched_at / error の変化）も含めて増える
+        self.state_at = 0.0    # 最後に取得状況かデバイス行が変わった時刻
+        self.aggregates = InventoryAggregates()
+        self.synced_generation = None  # 取り込み済みのスナップショットDBの世代番号
+        self.synced_at = 0.0
+        self.sync_task = None
+
+    @staticmethod
+    def shared():
+        return bool(get_settings().get("shared_cache")) and get_snapshot_store() is not None
+
+    @staticmethod
+    def ttl(kind, site_config):
+        ttl = site_config.get("cache_ttl")
+        if ttl is None:
+            ttl = get_settings().get("cache_ttl", CACHE_TTL)
+        return float(ttl)
+
+    def _state_changed(self, changed_at):
+        """取得状況（fetched_at / error）が変わったことを記録する"""
+        self.state_version += 1
+        self.state_at = max(self.state_at, changed_at)
+
+    def _changed(self, updated_at):
+        """デバイス行が変わったことを記録し、検索インデックスの再構築を裏で始める"""
+        self.version += 1
+        self.updated_at = max(self.updated_at, updated_at)
+        self._state_changed(updated_at)
+        _schedule_index_build()
+
+    def _load(self, kind, site_config, entry):
+        """取得中のタスクがあればそれを共有し、無ければ新しく開始する"""
+        if entry.task is None or entry.task.done():
+            entry.task = asyncio.ensure_future(self._fetch(kind, site_config, entry))
+        return entry.task
+
+    async def _fetch(self, kind, site_config, entry):
+        if not self.shared():
+            return await self._fetch_controller(kind, site_config, entry)
+        store = get_snapshot_store()
+        key = (kind, controller_name(site_config))
+        owner = _lease_owner()
+        requested = time.time()
+        loop = asyncio.get_running_loop()
+        try:
+            while not await loop.run_in_executor(None, store.acquire_lease, key, owner, SHARED_LEASE_TTL):
+                # 他のプロセスが取得中: 保存されるのを待ち、そのコントローラの分だけを読み込む
+                await asyncio.sleep(SHARED_POLL_INTERVAL)
+                await self.sync()
+                if entry.fetched_at >= requested:
+                    return entry.data
+        except sqlite3.Error as e:
+            print(f"[Warning] Shared cache unavailable, fetching directly: {e}", file=sys.stderr)
+            return await self._fetch_controller(kind, site_config, entry)
+        try:
+            # リースを取る直前に他のプロセスが取得・保存を終えていた場合はそれを使う
+            await self.sync()
+            if entry.fetched_at >= requested:
+                return entry.data
+            data = await self._fetch_controller(kind, site_config, entry)
+            # 待っている他のプロセスが読めるよう、リースを返す前に保存する
+            await self.save_snapshot()
+            return data
+        finally:
+            try:
+                await loop.run_in_executor(None, store.release_lease, key, owner)
+            except sqlite3.Error:
+                pass  # 期限切れで失効する
+
+    async def _fetch_controller(self, kind, site_config, entry):
+        started = time.perf_counter()
+        data = await FETCHERS[kind](site_config)
+        timings = controller_timings(DOMAIN_LABELS[kind], controller_name(site_config))
+        timings.observe("total", time.perf_counter() - started)
+        key = (kind, controller_name(site_config))
+        if self.entries.get(key) is not entry:
+            # 取得中に設定の変更で破棄されたコントローラの結果は反映しない
+            return data
+        now = time.time()
+        self._state_changed(now)
+        failed = _is_error_only(data)
+        entry.error = data[0]["error"] if failed else None
+        if failed:
+            entry.failed_at = now
+        if not (failed and entry.data is not None and not _is_error_only(entry.data)):
+            # 取得に失敗した場合は前回の正常データを保持し、失敗は error で参照させる
+            # 内容が前回と同じなら手元のリストをそのまま使い fetched_at だけを進める
+            # （バージョン・ETag・インデックスは変えず、保存済みのリビジョンも引き続き参照できる）
+            if entry.data != data:
+                self.aggregates.replace(key, data)
+                self._changed(now)
+                entry.data = data
+                entry.rev = None
+            entry.fetched_at = now
+            self.dirty = True
+        # 取得中のコントローラが無くなった時点でスナップショットを保存する
+        if not any(e.task is not None and not e.task.done() and e is not entry for e in self.entries.values()):
+            asyncio.ensure_future(self.save_snapshot())
+        return data
+
+    async def warm_start(self):
+        """最新スナップショットの内容でキャッシュを初期化する（プロセス起動時に1回だけ）"""
+        if self.warm is None:
+            self.warm = asyncio.ensure_future(self._warm_start())
+        await self.warm
+
+    async def _warm_start(self):
+        store = get_snapshot_store()
+        if store is None:
+            return
+        try:
+            controllers, _ = await asyncio.get_running_loop().run_in_executor(None, store.load)
+        except sqlite3.Error as e:
+            print(f"[Warning] Failed to load inventory snapshot: {e}", file=sys.stderr)
+            return
+        self.synced_at = time.monotonic()
+        # 設定から外れたコントローラのデータは読み込まない
+        configured = {(kind, controller_name(site)) for kind, site in list_controllers()}
+        for key, (fetched_at, data, rev) in controllers.items():
+            if key not in configured:
+                continue
+            entry = self.entries.setdefault(key, CacheEntry())
+            if entry.data is None:
+                entry.data = data
+                entry.fetched_at = fetched_at
+                entry.rev = rev
+                self.aggregates.replace(key, data)
+                self._changed(fetched_at)
+
+    async def sync(self):
+        """共有スナップショットから、他のプロセスが新しく取得したコントローラの分だけを取り込む"""
+        store = get_snapshot_store()
+        if store is None:
+            return
+        self.synced_at = time.monotonic()
+        known = {key: (e.fetched_at, e.rev) for key, e in self.entries.items()}
+        configured = {(kind, controller_name(site)) for kind, site in list_controllers()}
+        try:
+            generation, changed = await asyncio.get_running_loop().run_in_executor(
+                None, store.load_newer, self.synced_generation, known, configured)
+        except sqlite3.Error as e:
+            print(f"[Warning] Failed to read shared inventory snapshot: {e}", file=sys.stderr)
+            return
+        self.synced_generation = generation
+        for key, (fetched_at, data, rev) in changed.items():
+            entry = self.entries.setdefault(key, CacheEntry())
+            if fetched_at <= entry.fetched_at:
+                continue  # 読み込み中に自分で取得した方が新しい
+            if data is None or entry.data == data:
+                # 行は手元と同じ（他のプロセスが同じ内容を取得し直した）
+                self._state_changed(fetched_at)
+            else:
+                entry.data = data
+                self.aggregates.replace(key, data)
+                self._changed(fetched_at)
+            entry.fetched_at = fetched_at
+            entry.rev = rev
+            entry.error = entry.data[0]["error"] if _is_error_only(entry.data) else None
+
+    def _maybe_sync(self):
+        """SHARED_SYNC_INTERVAL ごとに、裏で sync を1つだけ走らせる（呼び出し側は待たない）"""
+        if time.monotonic() - self.synced_at >= SHARED_SYNC_INTERVAL and (
+                self.sync_task is None or self.sync_task.done()):
+            self.synced_at = time.monotonic()
+            self.sync_task = asyncio.ensure_future(self.sync())
+
+    async def save_snapshot(self):
+        """現在のキャッシュ内容をスナップショットとして保存する"""
+        if self.save_lock is None:
+            self.save_lock = asyncio.Lock()
+        async with self.save_lock:
+            store = get_snapshot_store()
+            if store is None or not self.dirty:
+                return None
+            self.dirty = False
+            controllers = {key: (e.fetched_at, e.data, e.rev) for key, e in self.entries.items() if e.data is not None}
+            configured = {(kind, controller_name(site)) for kind, site in list_controllers()}
+            try:
+                version, revs = await asyncio.get_running_loop().run_in_executor(
+                    None, store.save, controllers, configured)
+            except sqlite3.Error as e:
+                print(f"[Warning] Failed to save inventory snapshot: {e}", file=sys.stderr)
+                return None
+            # 保存中に差し替わっていないコントローラだけ、次回は行を書かずに済むようリビジョンを覚える
+            for key, rev in revs.items():
+                entry = self.entries.get(key)
+                if entry is not None and entry.data is controllers[key][1]:
+                    entry.rev = rev
+            return version
+
+    async def get(self, kind, site_config, force=False, allow_stale=True):
+        """
+        キャッシュからコントローラのインベントリを返す（必要ならロード）。
+        allow_stale=False の場合、TTL 切れのデータは再取得が終わるまで待つ。
+        force=True は必ずコントローラから取得するため、スナップショットからのウォームスタートは行わない。
+        """
+        if not force:
+            await self.warm_start()
+        if self.shared():
+            self._maybe_sync()
+        key = (kind, controller_name(site_config))
+        entry = self.entries.setdefault(key, CacheEntry())
+        if entry.data is None or force:
+            return await asyncio.shield(self._load(kind, site_config, entry))
+        if time.time() - entry.checked_at >= self.ttl(kind, site_config):
+            task = self._load(kind, site_config, entry)
+            if not allow_stale:
+                return await asyncio.shield(task)
+        return entry.data
+
+    async def refresh(self, kind, site_config, max_age=None):
+        """
+        コントローラを再取得する。max_age を指定した場合、max_age 秒以内に取得済み（shared_cache では
+        他のプロセスが取得したものも含む）であれば、コントローラには接続せずそのデータを返す。
+        """
+        if max_age is not None:
+            await self.warm_start()
+            if self.shared():
+                await self.sync()
+            entry = self.entries.get((kind, controller_name(site_config)))
+            if entry is not None and entry.data is not None and time.time() - entry.fetched_at < max_age:
+                return entry.data
+        return await self.get(kind, site_config, force=True)
+
+    def clear(self):
+        self.entries.clear()
+        self.aggregates.clear()
+        self.synced_generation = None
+
+INVENTORY_CACHE = InventoryCache()
+
+# ==============================================================================
+# Inventory Index
+# デバイス検索用インデックス（完全一致ハッシュ + トライグラム）
+# ==============================================================================
+
+# 相関に使わないシリアル / IP の値
+_SERIAL_PLACEHOLDERS = frozenset({"", "na", "none", "null", "unknown"})
+_IP_PLACEHOLDERS = frozenset({"", "n/a", "none", "null", "unknown", "cloud managed"})
+_SERIAL_STRIP = re.compile(r"[^0-9a-z]")
+
+def normalize_serials(value):
+    """
+    シリアル番号を照合用に正規化する（小文字化し英数字以外を除去）。
+    スタック構成などのカンマ区切りは各メンバーのシリアルとして返す。
+    """
+    return _serial_keys(str(value or "").lower())
+
+def _serial_keys(text):
+    keys = []
+    for part in text.split(",") if "," in text else (text,):
+        key = part if part.isalnum() else _SERIAL_STRIP.sub("", part)
+        if len(key) >= 4 and key not in _SERIAL_PLACEHOLDERS:
+            keys.append(key)
+    return keys
+
+def normalize_ip(value):
+    """
+    管理IPを照合用に正規化する（プレフィックス長を除去、IPv6 は短縮表記に統一）。
+    IPアドレスとして解釈できない値 ("Cloud Managed" 等) や未指定・ループバックのアドレスは None
+    """
+    return _ip_key(str(value or "").strip().lower())
+
+def _ip_key(ip):
+    if "/" in ip:
+        ip = ip.split("/", 1)[0]
+    if ip in _IP_PLACEHOLDERS:
+        return None
+    import ipaddress
+    try:
+        addr = ipaddress.ip_address(ip)
+    except ValueError:
+        return None
+    if addr.is_unspecified or addr.is_loopback:
+        return None
+    return addr.compressed
+
+class InventoryIndex:
+    """
+    デバイス一覧に対する検索インデックス。データ更新時に1回だけ構築する。
+    - name / serial / ip / id の完全一致（大文字小文字無視）はハッシュ引き
+    - 部分一致はトライグラムの転置リストで候補を絞ってから確認する
+    - 正規化したシリアル / 管理IP のハッシュ結合で、複数コントローラに現れる同一機器をまとめる
+    """
+    FIELDS = ("name", "serial", "ip", "id")
+
+    def __init__(self, rows, version=None, updated_at=0.0):
+        self.rows = rows
+        self.version = version        # 構築元データのキャッシュバージョン
+        self.updated_at = updated_at  # 構築元データの最終更新時刻
+        self.haystack = []   # 行ごとの検索対象文字列（小文字化済み、フィールドは \0 区切り）
+        self.exact = {}      # 小文字化した値 -> 行番号のリスト
+        self.trigrams = {}   # トライグラム -> 行番号の array
+        serials, ips = {}, {}  # 正規化した値 -> 最初の行番号（2行目以降は *_dups に集める）
+        serial_dups, ip_dups = {}, {}
+        for idx, row in enumerate(rows):
+            values = [str(row.get(f, "")).lower() for f in self.FIELDS]
+            # values[1] / values[2] は小文字化済みの serial / ip（error 行は空なのでキーにならない）
+            for key in _serial_keys(values[1]):
+                first = serials.setdefault(key, idx)
+                if first != idx:
+                    serial_dups.setdefault(key, [first]).append(idx)
+            key = _ip_key(values[2].strip())
+            if key is not None:
+                first = ips.setdefault(key, idx)
+                if first != idx:
+                    ip_dups.setdefault(key, [first]).append(idx)
+            text = "\0".join(values)
+            self.haystack.append(text)
+            for value in set(values):
+                if value:
+                    self.exact.setdefault(value, []).append(idx)
+            for gram in {text[i:i + 3] for i in range(len(text) - 2)}:
+                postings = self.trigrams.get(gram)
+                if postings is None:
+                    postings = self.trigrams[gram] = array("I")
+                postings.append(idx)
+        self._correlate(serial_dups, ip_dups)
+
+    def _correlate(self, serial_dups, ip_dups):
+        """
+        同じシリアル / 管理IPを持つ行を union-find でまとめ、複数コントローラにまたがるものを
+        identities（同一機器のまとまり）とする。重複のあったキーだけを処理するので行数にほぼ比例する。
+        """
+        rows = self.rows
+        parent = {}
+        matched = {}  # 行番号 -> 一致したキーの種類
+
+        def find(i):
+            root = i
+            while parent.get(root, root) != root:
+                root = parent[root]
+            while i != root:
+                parent[i], i = root, parent.get(i, i)
+            return root
+
+        def union(members, kind):
+            root = find(members[0])
+            for i in members:
+                matched.setdefault(i, set()).add(kind)
+                other = find(i)
+                if other != root:
+                    parent[other] = root
+
+        for members in serial_dups.values():
+            union(members, "serial")
+        for members in ip_dups.values():
+            # 同じコントローラ内で同じIPが複数ある（プライベートアドレスの再利用など）場合は同一機器とみなさない
+            owners = {(rows[i].get("domain"), rows[i].get("controller")) for i in members}
+            if len(owners) == len(members):
+                union(members, "ip")
+
+        groups = {}
+        for i in matched:
+            groups.setdefault(find(i), []).append(i)
+        self.identities = []   # [{"serials", "ips", "matched_on", "controllers", "devices"}]
+        self.identity_of = {}  # device_key -> identities の添字
+        for members in groups.values():
+            members.sort()
+            devices = [rows[i] for i in members]
+            controllers = sorted({f"{r.get('domain')}/{r.get('controller')}" for r in devices})
+            if len(controllers) < 2:
+                continue
+            for r in devices:
+                self.identity_of[device_key(r)] = len(self.identities)
+            self.identities.append({
+                "serials": sorted({k for r in devices for k in normalize_serials(r.get("serial"))}),
+                "ips": sorted({ip for ip in (normalize_ip(r.get("ip")) for r in devices) if ip}),
+                "matched_on": sorted(set().union(*(matched[i] for i in members))),
+                "controllers": controllers,
+                "devices": devices,
+            })
+
+    def correlated(self, row):
+        """row と同一機器と判定された、他のコントローラ上の行を返す"""
+        n = self.identity_of.get(device_key(row))
+        if n is None:
+            return []
+        return [r for r in self.identities[n]["devices"] if r is not row]
+
+    def lookup(self, value):
+        """name / serial / ip / id のいずれかが完全一致する行を返す"""
+        return [self.rows[i] for i in self.exact.get(str(value).lower(), [])]
+
+    def search(self, query):
+        """name / serial / ip / id のいずれかに query を含む行を元の順序で返す"""
+        q = str(query).lower()
+        if len(q) < 3:
+            # トライグラムを作れない短い語は事前に小文字化した文字列を走査
+            return [self.rows[i] for i, text in enumerate(self.haystack) if q in text]
+        postings = sorted((self.trigrams.get(q[i:i + 3], ()) for i in range(len(q) - 2)), key=len)
+        if not postings[0]:
+            return []
+        # 最も出現の少ないトライグラムの行だけを文字列照合で確認する
+        haystack = self.haystack
+        return [self.rows[i] for i in postings[0] if q in haystack[i]]
+
 # ==============================================================================
 # Aggregation Functions
 # 集約関数
 # ==============================================================================
 
-def get_aci_inventory():
+async def collect_inventory(domains=DOMAINS, force=False, allow_stale=True):
+    """指定ドメインの全コントローラを共有キャッシュ経由で並行取得する"""
+    tasks = []
+    for kind in domains:
+        for site in get_config().get(kind) or []:
+            tasks.append((kind, INVENTORY_CACHE.get(kind, site, force=force, allow_stale=allow_stale)))
+    combined_data = []
+    results = await asyncio.gather(*(t for _, t in tasks), return_exceptions=True)
+    for (kind, _), res in zip(tasks, results):
+        if isinstance(res, Exception):
+            combined_data.append({"error": f"Domain fetch error: {str(res)}"})
+        elif isinstance(res, list):
+            combined_data.extend(res)
+    return combined_data
+
+def get_aci_inventory(force=False):
     """設定された全てのACIサイトから取得"""
-    sites = CONFIG.get("ACI", [])
-    if not sites: return []
-    results = []
-    with ThreadPoolExecutor(max_workers=len(sites) or 1) as executor:
-        for res in executor.map(fetch_single_aci, sites):
-            results.extend(res)
-    return results
+    return run_sync(collect_inventory(["ACI"], force))
 
-def get_meraki_inventory():
+def get_meraki_inventory(force=False):
     """設定された全てのMeraki Orgから取得"""
-    orgs = CONFIG.get("MERAKI", [])
-    if not orgs: return []
-    results = []
-    with ThreadPoolExecutor(max_workers=len(orgs) or 1) as executor:
-        for res in executor.map(fetch_single_meraki, orgs):
-            results.extend(res)
-    return results
+    return run_sync(collect_inventory(["MERAKI"], force))
 
-def get_catalyst_inventory():
+def get_catalyst_inventory(force=False):
     """設定された全てのCatalyst Centerから取得"""
-    sites = CONFIG.get("CATALYST", [])
-    if not sites: return []
-    results = []
-    with ThreadPoolExecutor(max_workers=len(sites) or 1) as executor:
-        for res in executor.map(fetch_single_catalyst, sites):
-            results.extend(res)
-    return results
+    return run_sync(collect_inventory(["CATALYST"], force))
 
-def get_sdwan_inventory():
+def get_sdwan_inventory(force=False):
     """設定された全てのSD-WAN vManageから取得"""
-    sites = CONFIG.get("SDWAN", [])
-    if not sites: return []
-    results = []
-    with ThreadPoolExecutor(max_workers=len(sites) or 1) as executor:
-        for res in executor.map(fetch_single_sdwan, sites):
-            results.extend(res)
-    return results
+    return run_sync(collect_inventory(["SDWAN"], force))
 
-def get_all_inventory():
-    """登録されている全ドメイン・全サイトから一括並列取得"""
-    tasks = [get_aci_inventory, get_meraki_inventory, get_catalyst_inventory, get_sdwan_inventory]
-    combined_data = []
-    with ThreadPoolExecutor(max_workers=len(tasks)) as executor:
-        for future in [executor.submit(t) for t in tasks]:
-            try:
-                res = future.result()
-                if isinstance(res, list): combined_data.extend(res)
-            except Exception as e:
-                combined_data.append({"error": f"Domain fetch error: {str(e)}"})
-    return combined_data
\ No newline at end of file
+def get_all_inventory(force=False, allow_stale=True):
+    """
+    登録されている全ドメイン・全サイトから一括並列取得。
+    共有キャッシュを使い、force=True の場合は全コントローラを再取得する。
+    allow_stale=False の場合は TTL 切れのデータを返さず再取得を待つ。
+    """
+    return run_sync(collect_inventory(DOMAINS, force, allow_stale))
+
+def iter_inventory(domains=DOMAINS, force=False, allow_stale=True):
+    """
+    全コントローラを並行取得し、終わったものから順に (kind, site_config, rows) を返すジェネレータ。
+    最も遅いコントローラを待たずに、先に応答したコントローラの結果を表示・処理できる。
+    キャッシュ・force・allow_stale の扱いは get_all_inventory と同じ。
+    """
+    loop = _get_loop()
+    futures = {
+        asyncio.run_coroutine_threadsafe(INVENTORY_CACHE.get(kind, site, force=force, allow_stale=allow_stale), loop):
+        (kind, site)
+        for kind, site in list_controllers(domains)
+    }
+    # 途中で打ち切られても取得自体はキャッシュ側で続行され、結果は次回以降に使われる
+    for future in concurrent.futures.as_completed(futures):
+        kind, site = futures[future]
+        try:
+            rows = future.result()
+        except Exception as e:
+            rows = [{"domain": DOMAIN_LABELS[kind], "controller": controller_name(site),
+                     "error": f"Domain fetch error: {str(e)}"}]
+        yield kind, site, rows
+
+def get_inventory_version():
+    """
+    キャッシュのバージョン番号と最終更新時刻を返す（コントローラへは接続しない）。
+    バージョンはデバイス行が変わった時だけ増える（同じ内容の再取得では変わらない）。
+    データより先に取得しておけば、返したデータは必ずこのバージョン以降のものになる。
+    """
+    return INVENTORY_CACHE.version, INVENTORY_CACHE.updated_at
+
+def get_state_version():
+    """
+    取得状況（get_controller_states の fetched_at / error）の変化も含めて増えるバージョン番号と、
+    その最終変化時刻を返す
+    """
+    return INVENTORY_CACHE.state_version, INVENTORY_CACHE.state_at
+
+async def _load_all():
+    # 全コントローラをキャッシュに載せる（行の結合はしない）
+    await asyncio.gather(*(INVENTORY_CACHE.get(kind, site) for kind, site in list_controllers()),
+                         return_exceptions=True)
+
+def get_inventory_summary():
+    """
+    インベントリ全体の集計値を返す（取得済みデータから差分更新された値を読むだけ）。
+    {"total_devices", "controller_errors", "unhealthy_devices", "health_issues",
+     "by_domain", "by_controller", "by_status", "by_model", "by_version"}
+    """
+    run_sync(_load_all())
+    return INVENTORY_CACHE.aggregates.summary
+
+_INDEX = None                    # 最後に構築した検索インデックス
+_INDEX_LOCK = threading.Lock()   # 構築は同時に1つだけ
+_INDEX_STATE_LOCK = threading.Lock()
+_INDEX_BUILDER = None            # 裏で再構築しているスレッド
+_INDEX_PENDING = False           # 再構築中にさらにデータが変わったか
+
+async def _versioned_inventory():
+    # 未取得のコントローラを読み込んでからバージョンを記録し、行を集める間に更新があれば次回に再構築させる
+    await INVENTORY_CACHE.warm_start()
+    await _load_all()
+    version, updated_at = INVENTORY_CACHE.version, INVENTORY_CACHE.updated_at
+    return version, updated_at, await collect_inventory(DOMAINS)
+
+def _build_index():
+    global _INDEX
+    with _INDEX_LOCK:
+        version, updated_at, data = run_sync(_versioned_inventory())
+        if _INDEX is None or _INDEX.version != version:
+            _INDEX = InventoryIndex(data, version, updated_at)
+        return _INDEX
+
+def _index_worker():
+    global _INDEX_BUILDER, _INDEX_PENDING
+    while True:
+        with _INDEX_STATE_LOCK:
+            if not _INDEX_PENDING:
+                _INDEX_BUILDER = None
+                return
+            _INDEX_PENDING = False
+        try:
+            _build_index()
+        except Exception as e:
+            print(f"[Warning] Failed to rebuild inventory index: {e}", file=sys.stderr)
+
+def _schedule_index_build():
+    """
+    データが変わった時に、検索インデックスを別スレッドで作り直す（一度も使われていなければ何もしない）。
+    構築中に続けて変わった分は、構築が終わった後の1回にまとめる。
+    """
+    global _INDEX_BUILDER, _INDEX_PENDING
+    if _INDEX is None:
+        return
+    with _INDEX_STATE_LOCK:
+        _INDEX_PENDING = True
+        if _INDEX_BUILDER is None:
+            _INDEX_BUILDER = threading.Thread(target=_index_worker, name="inventory-indexer", daemon=True)
+            _INDEX_BUILDER.start()
+
+def get_inventory_index():
+    """
+    現在のインベントリに対する検索インデックスを返す。
+    再構築はデータが変わった時に裏で行い、その間は直前のインデックスを返す（初回だけはその場で構築する）。
+    """
+    index = _INDEX
+    if index is None:
+        return _build_index()
+    run_sync(_load_all())  # TTL 切れのコントローラは裏で再取得を始める
+    if index.version != INVENTORY_CACHE.version:
+        _schedule_index_build()
+    return index
+
+def get_device_identities():
+    """
+    複数のコントローラ（ドメイン）に現れる同一機器のまとまりを返す。
+    正規化したシリアル番号または管理IPが一致する行を1つの identity とする（インデックス構築時に計算済み）。
+    """
+    return get_inventory_index().identities
+
+QUERY_CACHE_SIZE = 16
+_QUERY_CACHE = OrderedDict()
+_QUERY_LOCK = threading.Lock()
+
+def _matches(value, wanted):
+    return wanted is None or str(value or "").lower() == wanted
+
+def query_inventory(domain=None, controller=None, status=None, text=None, sort=None, descending=False):
+    """
+    条件に合うデバイス行（error 行を除く）のリストを返す。
+    domain / controller / status は大文字小文字を無視した完全一致、text は部分一致。
+    同じ条件の結果はインベントリが更新されるまで再利用する（ページ送り用）。
+    """
+    index = get_inventory_index()
+    domain, controller, status = (str(v).lower() if v else None for v in (domain, controller, status))
+    if sort not in DEVICE_FIELDS:
+        sort = None
+    key = (index.version, domain, controller, status, text or None, sort, bool(descending))
+    with _QUERY_LOCK:
+        if key in _QUERY_CACHE:
+            _QUERY_CACHE.move_to_end(key)
+            return _QUERY_CACHE[key]
+    rows = index.search(text) if text else index.rows
+    rows = [r for r in rows if "error" not in r
+            and _matches(r.get("domain"), domain)
+            and _matches(r.get("controller"), controller)
+            and _matches(r.get("status"), status)]
+    if sort:
+        rows.sort(key=lambda r: str(r.get(sort) or "").lower(), reverse=bool(descending))
+    with _QUERY_LOCK:
+        _QUERY_CACHE[key] = rows
+        while len(_QUERY_CACHE) > QUERY_CACHE_SIZE:
+            _QUERY_CACHE.popitem(last=False)
+    return rows
+
+def save_snapshot():
+    """キャッシュ内容を直ちにスナップショットとして保存する（更新が無ければ何もしない）"""
+    return run_sync(INVENTORY_CACHE.save_snapshot())
+
+def list_controllers(domains=DOMAINS):
+    """設定済みのコントローラを (kind, site_config) のリストで返す"""
+    return [(kind, site) for kind in domains for site in get_config().get(kind) or []]
+
+def _controller_fingerprints(config):
+    """設定内の全コントローラの (kind, controller) -> (site_config, fingerprint)"""
+    return {(kind, controller_name(site)): (site, _site_fingerprint(site))
+            for kind in DOMAINS for site in (config or {}).get(kind) or []}
+
+def _apply_config(config):
+    """
+    新しい設定に差し替え、追加・削除・変更されたコントローラだけを処理する（_CONFIG_LOCK 内で呼ぶ）。
+    削除・変更されたコントローラのキャッシュとセッションを破棄し、追加・変更されたものは裏で取得を始める。
+    それ以外のコントローラのキャッシュ・セッション・トークンはそのまま使い続ける。
+    """
+    global _CONFIG
+    old = _CONFIG or {}
+    before, after = _controller_fingerprints(old), _controller_fingerprints(config)
+    stale = [key for key, (_, fp) in before.items() if key not in after or after[key][1] != fp]
+    fresh = [(key[0], site) for key, (site, fp) in after.items() if key not in before or before[key][1] != fp]
+    _CONFIG = config
+    if old.get("SETTINGS") != config.get("SETTINGS"):
+        # 同時実行数などの設定は次に確保するセマフォから反映する
+        _LIMITS.clear()
+    if (stale or fresh) and _ENGINE_LOOP is not None:
+        _ENGINE_LOOP.call_soon_threadsafe(_reload_controllers, stale, fresh, set(after))
+
+def _reload_controllers(stale, fresh, configured):
+    """エンジンのループ上で、設定から外れた/変わったコントローラを破棄し、新しい設定で取得し直す"""
+    cache = INVENTORY_CACHE
+    for key in stale:
+        if cache.entries.pop(key, None) is not None:
+            cache.aggregates.replace(key, None)
+            cache._changed(time.time())
+            cache.dirty = True
+        with _SESSION_POOL_LOCK:
+            entry = _SESSION_POOL.pop(key, None)
+        if entry is not None:
+            asyncio.ensure_future(entry[1].client.aclose())
+        if key not in configured:
+            label = (DOMAIN_LABELS[key[0]], key[1])
+            REQUEST_STATS.pop(label, None)
+            TIMING_STATS.pop(label, None)
+    for kind, site in fresh:
+        asyncio.ensure_future(cache.get(kind, site, force=True))
+
+def refresh_interval(kind, site_config):
+    """バックグラウンド再取得の間隔（site の refresh_interval > SETTINGS.refresh_interval > キャッシュTTL）"""
+    interval = site_config.get("refresh_interval") or get_settings().get("refresh_interval")
+    return float(interval or InventoryCache.ttl(kind, site_config))
+
+def refresh_controller(kind, site_config, max_age=None):
+    """
+    1コントローラの再取得をバックグラウンドで開始する（完了は待たない。取得中なら相乗りする）。
+    max_age 秒以内に取得済み（shared_cache では他のプロセスの取得を含む）なら再取得しない。
+    """
+    return asyncio.run_coroutine_threadsafe(INVENTORY_CACHE.refresh(kind, site_config, max_age), _get_loop())
+
+def refresh_all():
+    """全コントローラの再取得をバックグラウンドで開始する"""
+    return [refresh_controller(kind, site) for kind, site in list_controllers()]
+
+def get_controller_states():
+    """
+    コントローラごとの取得状況を返す（名前が同じでもドメインが違えば別のコントローラとして扱う）。
+    {(kind, controller): {"domain", "controller", "devices", "fetched_at", "refreshing", "error", "failed_at"}}
+    devices はそのコントローラの台数（error 行を除く）。
+    """
+    states = {}
+    for kind, site in list_controllers():
+        key = (kind, controller_name(site))
+        entry = INVENTORY_CACHE.entries.get(key)
+        part = INVENTORY_CACHE.aggregates.parts.get(key)
+        states[key] = {
+            "domain": DOMAIN_LABELS[kind],
+            "controller": key[1],
+            "devices": part[0] if part else 0,
+            "fetched_at": entry.fetched_at if entry else 0.0,
+            "refreshing": bool(entry and entry.task is not None and not entry.task.done()),
+            "error": entry.error if entry else None,
+            "failed_at": entry.failed_at if entry else 0.0,
+        }
+    return states
+
+def warm_start():
+    """
+    最新スナップショットでキャッシュを即座に初期化し、TTL 切れのコントローラは
+    バックグラウンドで再取得を開始する（Web / MCP サーバーの起動時用）
+    """
+    asyncio.run_coroutine_threadsafe(collect_inventory(DOMAINS), _get_loop())
@@ -3,8 +3,16 @@
 # SPDX-License-Identifier: MIT
 
 import json
+from typing import Optional
 from mcp.server.fastmcp import FastMCP
 from multidomain_inventory_core import (
+    DEVICE_FIELDS,
+    get_timing_stats,
+    is_unhealthy,
+    get_inventory_summary as get_summary_counts,
+    warm_start,
+    get_inventory_version,
+    get_inventory_index,
     get_all_inventory, 
     get_aci_inventory, 
     get_meraki_inventory, 
@@ -25,38 +33,163 @@ mcp = FastMCP("Cisco-MultiDomain-Inventory")
 def get_inventory_summary() -> str:
     """
     Returns a high-level summary of the network inventory across all domains.
-    Includes total device counts, breakdown by domain, and a count of unhealthy devices.
+    Includes total device counts, breakdowns by domain, controller, status, model and version,
+    and the number of health issues (unhealthy devices + controller errors).
     
     全ドメインにわたるネットワークインベントリの概要サマリーを返します。
-    デバイス総数、ドメインごとの内訳、および異常な状態のデバイス数を含みます。
+    デバイス総数、ドメイン・コントローラ・ステータス・モデル・バージョンごとの内訳、
+    および異常の件数（異常デバイス + コントローラのエラー）を含みます。
     """
-    # Get data from all domains
-    # 全ドメインからデータを取得
-    data = get_all_inventory()
-    
-    # Define statuses that are considered "unhealthy"
-    # "異常 (unhealthy)" とみなされるステータスを定義
-    unhealthy_statuses = ["offline", "unreachable", "error", "inactive", "alerting", "unknown"]
+    # Aggregates are maintained by the core as each controller's data is merged
+    # 集計値は Core 側でコントローラのデータ更新時に差分更新されているので読むだけ
+    return json.dumps(get_summary_counts(), indent=2, ensure_ascii=False)
+
+@mcp.resource("inventory://timings")
+def get_collection_timings() -> str:
+    """
+    Returns per-controller collection timings: seconds spent in auth, HTTP requests, JSON decode,
+    transform and the whole fetch (count / total / last), plus bytes received.
+    Use this to find which controller or phase makes a sweep slow.
     
-    summary = {
-        "total_devices": len(data),
-        "by_domain": {},
-        "health_issues": 0
+    コントローラごとの取得時間（認証・HTTP・JSONデコード・変換・取得全体の回数/合計/直近値）と受信バイト数を返します。
+    どのコントローラ・どの処理が遅いのかを調べる時に使用します。
+    """
+    timings = {}
+    for key, t in get_timing_stats().items():
+        timings[key] = {
+            "domain": t["domain"],
+            "controller": t["controller"],
+            "bytes": t["bytes"],
+            **{phase: {"count": h["count"], "sum_s": round(h["sum"], 4), "last_s": round(h["last"], 4)}
+               for phase, h in t["phases"].items()},
+        }
+    return json.dumps(timings, indent=2, ensure_ascii=False)
+
+# ==============================================================================
+# OUTPUT HELPERS: Projection / Paging / Compact Encoding
+# 出力ヘルパー: フィールド射影・ページング・コンパクトなエンコード
+# ==============================================================================
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+
+def read_cursor(cursor, version):
+    """
+    Decodes a "<inventory version>.<offset>" cursor. Returns (offset, None), or (None, error message)
+    when the cursor is malformed or was issued for another inventory version (the rows may have shifted).
+
+    "<インベントリのバージョン>.<オフセット>" 形式のカーソルを解釈し (offset, None) を返します。
+    形式が不正な場合や、別のバージョンのインベントリで発行されたカーソル（行がずれている可能性がある）の場合は
+    (None, エラーメッセージ) を返します。
+    """
+    if not cursor:
+        return 0, None
+    issued, _, offset = str(cursor).partition(".")
+    try:
+        offset = max(0, int(offset))
+    except ValueError:
+        return None, f"Error: invalid cursor '{cursor}'"
+    if issued != str(version):
+        return None, (f"Error: the inventory has changed since cursor '{cursor}' was issued. "
+                      "Request the first page again without a cursor.")
+    return offset, None
+
+def next_cursor(version, end, total):
+    return f"{version}.{end}" if end < total else None
+
+def read_versioned(load):
+    """
+    Calls load() and returns (inventory version, rows); retried if the inventory changed meanwhile,
+    so the version always matches the rows that are paged.
+
+    load() を呼び (インベントリのバージョン, 行) を返します。途中で更新された場合は読み直し、
+    バージョンがページングする行と必ず一致するようにします。
+    """
+    while True:
+        version, _ = get_inventory_version()
+        rows = load()
+        if get_inventory_version()[0] == version:
+            return version, rows
+
+def encode_page(rows, fields=None, limit=DEFAULT_LIMIT, cursor=None, layout="records", version=None,
+                item="devices"):
+    """
+    Returns one page of rows as compact JSON wrapped in a {total, next_cursor, ...} envelope.
+    layout="records" returns a list of objects, layout="table" returns columns + rows (smallest output).
+    version is the inventory version the rows were read at; it is embedded in next_cursor.
+    item="identities" pages cross-domain identities instead of devices (records only; fields applies to
+    each identity's devices).
+
+    行の1ページ分を {total, next_cursor, ...} 形式のコンパクトなJSONで返します。
+    layout="records" はオブジェクトのリスト、layout="table" は列名+値の配列（最も小さい出力）です。
+    version は rows を読んだ時点のインベントリのバージョンで、next_cursor に埋め込みます。
+    item="identities" ではデバイスの代わりに重複機器の identity をページングします
+    （records のみ。fields は各 identity のデバイスに適用）。
+    """
+    offset, error = read_cursor(cursor, version)
+    if error:
+        return error
+    limit = min(MAX_LIMIT, max(1, int(limit or DEFAULT_LIMIT)))
+    columns = [f for f in (fields or DEVICE_FIELDS) if f in DEVICE_FIELDS] or list(DEVICE_FIELDS)
+    page = rows[offset:offset + limit]
+    end = offset + len(page)
+    envelope = {
+        "total": len(rows),
+        "next_cursor": next_cursor(version, end, len(rows)),
     }
-    
-    for device in data:
-        # Count by domain
-        # ドメインごとにカウント
-        domain = device.get("domain", "Unknown")
-        summary["by_domain"][domain] = summary["by_domain"].get(domain, 0) + 1
-        
-        # Check for health issues
-        # 健康状態（異常有無）のチェック
-        status = str(device.get("status", "")).lower()
-        if "error" in device or status in unhealthy_statuses:
-            summary["health_issues"] += 1
-            
-    return json.dumps(summary, indent=2, ensure_ascii=False)
+    if item == "identities":
+        envelope["identities"] = [
+            {**{k: v for k, v in i.items() if k != "devices"},
+             "devices": [{c: d.get(c) for c in columns} for d in i["devices"]]}
+            for i in page
+        ]
+    elif layout == "table":
+        # Controller errors have no device fields; they are listed separately
+        # コントローラのエラー行はデバイス項目を持たないため別枠で返す
+        envelope["columns"] = columns
+        envelope["rows"] = [[r.get(c) for c in columns] for r in page if "error" not in r]
+        envelope["errors"] = [r for r in page if "error" in r]
+    else:
+        envelope["devices"] = [
+            r if "error" in r else {c: r.get(c) for c in columns} for r in page
+        ]
+    return json.dumps(envelope, ensure_ascii=False, separators=(",", ":"))
+
+PAGING_ARGS = """
+        fields: Optional list of device fields to return (subset of: id, domain, controller, name, status,
+                model, serial, version, ip, dashboard_url). Defaults to all fields.
+                返すデバイスのフィールドのリスト（省略時は全フィールド）。dashboard_url を除くと出力を大きく削減できます。
+        limit: Maximum number of {item} per call (default {default_limit}, max {max_limit}).
+               1回あたりの最大件数（既定{default_limit}、最大{max_limit}）。
+        cursor: Pass the 'next_cursor' value from the previous response to get the next page.
+                If the inventory changed in between, an error asks you to start again from the first page.
+                前回の応答の 'next_cursor' を指定すると次のページを取得します。
+                間にインベントリが更新された場合は、最初のページからの取得し直しを求めるエラーになります。"""
+
+LAYOUT_ARG = """
+        layout: 'records' (list of objects) or 'table' (columns + rows, most compact).
+                'records'（オブジェクトのリスト）または 'table'（列+行、最もコンパクト）。"""
+
+def paging_args(item="devices", layout=True):
+    """
+    Appends the shared description of the paging parameters (fields/limit/cursor[/layout]) to a tool's
+    Args section, so every paged tool documents the same cursor contract as encode_page.
+    Apply it beneath @mcp.tool(), which reads the docstring when the tool is registered.
+
+    ページング用パラメータ (fields/limit/cursor[/layout]) の共通説明をツールの Args 節に追記します。
+    ページングする全ツールが encode_page と同じカーソルの仕様を説明するようにするためのものです。
+    登録時に docstring を読む @mcp.tool() の下に付けてください。
+    """
+    text = PAGING_ARGS.format(item=item, default_limit=DEFAULT_LIMIT, max_limit=MAX_LIMIT)
+    if layout:
+        text += LAYOUT_ARG
+    def decorate(fn):
+        doc = fn.__doc__.rstrip()
+        if "Args:" not in doc:
+            doc += "\n    \n    Args:"
+        fn.__doc__ = doc + text + "\n    "
+        return fn
+    return decorate
 
 # ==============================================================================
 # TOOLS: Actions / Functions
@@ -64,22 +197,27 @@ def get_inventory_summary() -> str:
 # ==============================================================================
 
 @mcp.tool()
-def get_full_inventory() -> str:
+@paging_args()
+def get_full_inventory(fields: Optional[list[str]] = None, limit: int = DEFAULT_LIMIT,
+                       cursor: Optional[str] = None, layout: str = "records") -> str:
     """
-    Retrieves the complete inventory list from all registered domains (ACI, Meraki, Catalyst, SD-WAN).
-    Use this sparingly as the output can be large.
+    Retrieves the inventory list from all registered domains (ACI, Meraki, Catalyst, SD-WAN), one page at a time.
+    The response is {"total", "next_cursor", "devices"}; follow 'next_cursor' to read further pages.
     
-    登録されている全ドメイン (ACI, Meraki, Catalyst, SD-WAN) から完全なインベントリリストを取得します。
-    出力が大きくなる可能性があるため、必要な場合のみ使用してください。
+    登録されている全ドメイン (ACI, Meraki, Catalyst, SD-WAN) のインベントリをページ単位で取得します。
+    応答は {"total", "next_cursor", "devices"} 形式です。続きは 'next_cursor' を指定して取得してください。
     """
-    return json.dumps(get_all_inventory(), indent=2, ensure_ascii=False)
+    version, rows = read_versioned(get_all_inventory)
+    return encode_page(rows, fields, limit, cursor, layout, version)
 
 @mcp.tool()
-def get_domain_inventory(domain: str) -> str:
+@paging_args()
+def get_domain_inventory(domain: str, fields: Optional[list[str]] = None, limit: int = DEFAULT_LIMIT,
+                         cursor: Optional[str] = None, layout: str = "records") -> str:
     """
-    Retrieves inventory for a specific network domain.
+    Retrieves inventory for a specific network domain, one page at a time.
     
-    特定のネットワークドメインのインベントリを取得します。
+    特定のネットワークドメインのインベントリをページ単位で取得します。
     
     Args:
         domain: The target domain (valid options: 'aci', 'meraki', 'catalyst', 'sdwan').
@@ -95,64 +233,93 @@ def get_domain_inventory(domain: str) -> str:
     d = domain.lower()
     for key, func in domain_map.items():
         if key in d:
-            return json.dumps(func(), indent=2, ensure_ascii=False)
+            version, rows = read_versioned(func)
+            return encode_page(rows, fields, limit, cursor, layout, version)
             
     # Return error message if domain is not found
     # ドメインが見つからない場合はエラーメッセージを返す
     return f"Error: '{domain}' is not a supported domain. Available options: {list(domain_map.keys())}"
 
 @mcp.tool()
-def search_devices(query: str) -> str:
+@paging_args()
+def search_devices(query: str, fields: Optional[list[str]] = None, limit: int = DEFAULT_LIMIT,
+                   cursor: Optional[str] = None, layout: str = "records") -> str:
     """
     Searches for devices across all domains by matching a keyword.
+    Devices whose name, serial, IP or ID equals the keyword exactly are listed first.
     
     キーワードを使用して全ドメインのデバイスを横断検索します。
+    名前・シリアル・IP・ID が完全に一致するデバイスが先頭に並びます。
     
     Args:
         query: The search term (matches against Name, Serial Number, IP Address, or ID).
                検索語句（名前、シリアル番号、IPアドレス、またはIDに一致）。
     """
-    data = get_all_inventory()
-    q = query.lower()
-    
-    # Filter devices matching the query
-    # クエリに一致するデバイスをフィルタリング
-    results = [
-        d for d in data 
-        if q in str(d.get("name", "")).lower() or 
-           q in str(d.get("serial", "")).lower() or 
-           q in str(d.get("ip", "")).lower() or
-           q in str(d.get("id", "")).lower()
-    ]
+    # Look up matching devices via the prebuilt index (rebuilt only when the inventory changes):
+    # exact matches (hash lookup) first, then the remaining substring matches in inventory order
+    # インベントリ更新時にのみ構築されるインデックスで検索（完全一致を先頭に、残りの部分一致を元の順序で続ける）
+    index = get_inventory_index()
+    results = index.lookup(query)
+    exact = {id(r) for r in results}
+    results += [r for r in index.search(query) if id(r) not in exact]
     
     if not results:
         return f"No devices found matching query: '{query}'"
         
-    return json.dumps(results, indent=2, ensure_ascii=False)
+    return encode_page(results, fields, limit, cursor, layout, index.version)
 
 @mcp.tool()
-def get_unhealthy_devices() -> str:
+@paging_args()
+def get_unhealthy_devices(fields: Optional[list[str]] = None, limit: int = DEFAULT_LIMIT,
+                          cursor: Optional[str] = None, layout: str = "records") -> str:
     """
     Retrieves a list of devices that are currently in an abnormal state.
-    Filters for statuses such as 'offline', 'unreachable', 'error', 'inactive', or 'alerting'.
+    Filters for statuses such as 'offline', 'unreachable', 'error', 'inactive', 'alerting' or 'unknown'.
     Useful for troubleshooting and health checks.
     
     現在異常な状態にあるデバイスのリストを取得します。
-    'offline', 'unreachable', 'error', 'inactive', 'alerting' などのステータスでフィルタリングします。
+    'offline', 'unreachable', 'error', 'inactive', 'alerting', 'unknown' などのステータスでフィルタリングします。
     トラブルシューティングやヘルスチェックに役立ちます。
     """
-    data = get_all_inventory()
-    unhealthy_statuses = ["offline", "unreachable", "error", "inactive", "alerting"]
-    
-    issues = [
-        d for d in data 
-        if str(d.get("status", "")).lower() in unhealthy_statuses or "error" in d
-    ]
+    version, data = read_versioned(get_all_inventory)
+    issues = [d for d in data if is_unhealthy(d)]
     
     if not issues:
         return "No unhealthy devices found. All systems appear normal."
         
-    return json.dumps(issues, indent=2, ensure_ascii=False)
+    return encode_page(issues, fields, limit, cursor, layout, version)
+
+@mcp.tool()
+@paging_args("identities", layout=False)
+def find_cross_domain_devices(query: Optional[str] = None, fields: Optional[list[str]] = None,
+                              limit: int = DEFAULT_LIMIT, cursor: Optional[str] = None) -> str:
+    """
+    Lists physical devices that appear under more than one controller or domain
+    (e.g. a Catalyst switch managed by Catalyst Center and monitored by Meraki, or an SD-WAN edge also in Catalyst Center).
+    Devices are matched on normalized serial number or management IP.
+    The response is {"total", "next_cursor", "identities"}; each identity has serials, ips, matched_on,
+    controllers and the matching device records.
+    
+    複数のコントローラ・ドメインに重複して登録されている同一の物理機器を一覧します
+    （例: Catalyst Center と Meraki の両方で管理されているスイッチ、Catalyst Center にも登録された SD-WAN エッジ）。
+    正規化したシリアル番号または管理IPで照合します。
+    応答は {"total", "next_cursor", "identities"} 形式で、各 identity は serials, ips, matched_on, controllers と
+    該当するデバイスのレコードを含みます。
+    
+    Args:
+        query: Optional keyword to narrow the result (matches Name, Serial Number, IP Address or ID of any member).
+               結果を絞り込むキーワード（いずれかのデバイスの名前、シリアル番号、IPアドレス、IDに部分一致）。
+    """
+    index = get_inventory_index()
+    identities = index.identities
+    if query:
+        q = str(query).lower()
+        identities = [i for i in identities
+                      if any(q in str(d.get(f, "")).lower() for d in i["devices"] for f in ("name", "serial", "ip", "id"))]
+    if not identities:
+        return "No devices found under more than one controller."
+
+    return encode_page(identities, fields, limit, cursor, version=index.version, item="identities")
 
 # ==============================================================================
 # PROMPTS: Pre-defined Templates (Updated with Skill Instructions)
@@ -208,4 +375,7 @@ def investigate_device(hostname_or_ip: str) -> str:
     """
 
 if __name__ == "__main__":
+    # Serve the last snapshot immediately and refresh controllers in the background
+    # 前回のスナップショットで即応答し、コントローラからの再取得はバックグラウンドで行う
+    warm_start()
     mcp.run()
\ No newline at end of file
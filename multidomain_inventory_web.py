@@ -2,18 +2,26 @@
 #
 # SPDX-License-Identifier: MIT
 
-from flask import Flask, render_template_string, make_response, redirect, url_for
+from flask import Flask, Response, make_response, redirect, url_for, request, jsonify
 import io
+import os
 import csv
+import json
 import time
-from multidomain_inventory_core import get_all_inventory
+import zlib
+import hashlib
+import threading
+from multidomain_inventory_core import (
+    get_state_version, get_inventory_summary, query_inventory, get_inventory_index, warm_start,
+    list_controllers, controller_name, refresh_controller, refresh_all, refresh_interval, get_controller_states,
+    get_timing_stats, get_request_stats, json_default, Device
+)
 
 app = Flask(__name__)
 
-# --- グローバルキャッシュ (Web表示の高速化用) ---
-DATA_CACHE = None
-LAST_UPDATE = 0
-CACHE_DURATION = 300 # 5分間はキャッシュを使う
+# /api/devices のページサイズ
+API_PAGE_SIZE = 100
+API_MAX_PAGE_SIZE = 1000
 
 # --- UIテキスト (多言語対応) ---
 UI_TEXT = {
@@ -25,7 +33,10 @@ UI_TEXT = {
         'lbl_total': 'Total Devices',
         'lbl_controller_breakdown': 'Breakdown by Controller',
         'col_domain': 'Domain', 'col_controller': 'Controller / Site', 'col_name': 'Name (Click for Detail)', 
-        'col_model': 'Model', 'col_serial': 'Serial / UUID', 'col_version': 'Version', 'col_ip': 'Mgmt / System IP'
+        'col_model': 'Model', 'col_serial': 'Serial / UUID', 'col_version': 'Version', 'col_ip': 'Mgmt / System IP',
+        'col_also_in': 'Also Seen In',
+        'lbl_search': 'Search name / serial / IP', 'lbl_all_domains': 'All domains', 'lbl_all_controllers': 'All controllers',
+        'lbl_status': 'Status', 'btn_prev': 'Prev', 'btn_next': 'Next', 'lbl_loading': 'Loading...', 'lbl_updated': 'Updated'
     },
     'ja': {
         'title': 'Cisco マルチドメイン 資産管理ダッシュボード',
@@ -35,7 +46,10 @@ UI_TEXT = {
         'lbl_total': '総デバイス数',
         'lbl_controller_breakdown': 'コントローラ別 内訳',
         'col_domain': 'ドメイン', 'col_controller': 'コントローラ / 拠点', 'col_name': 'ホスト名 (クリックで詳細)', 
-        'col_model': 'モデル', 'col_serial': 'シリアル / UUID', 'col_version': 'バージョン', 'col_ip': '管理IP / System IP'
+        'col_model': 'モデル', 'col_serial': 'シリアル / UUID', 'col_version': 'バージョン', 'col_ip': '管理IP / System IP',
+        'col_also_in': '他の管理元',
+        'lbl_search': 'ホスト名 / シリアル / IP で検索', 'lbl_all_domains': '全ドメイン', 'lbl_all_controllers': '全コントローラ',
+        'lbl_status': 'ステータス', 'btn_prev': '前へ', 'btn_next': '次へ', 'lbl_loading': '読み込み中...', 'lbl_updated': '更新'
     },
     'ko': {
         'title': 'Cisco 멀티도메인 자산 관리 대시보드',
@@ -45,7 +59,10 @@ UI_TEXT = {
         'lbl_total': '총 장치 수',
         'lbl_controller_breakdown': '컨트롤러 별 내역',
         'col_domain': '도메인', 'col_controller': '컨트롤러 / 사이트', 'col_name': '호스트 이름 (클릭 시 상세)', 
-        'col_model': '모델', 'col_serial': '시리얼 / UUID', 'col_version': '버전', 'col_ip': '관리 IP / System IP'
+        'col_model': '모델', 'col_serial': '시리얼 / UUID', 'col_version': '버전', 'col_ip': '관리 IP / System IP',
+        'col_also_in': '다른 관리 도메인',
+        'lbl_search': '호스트 이름 / 시리얼 / IP 검색', 'lbl_all_domains': '모든 도메인', 'lbl_all_controllers': '모든 컨트롤러',
+        'lbl_status': '상태', 'btn_prev': '이전', 'btn_next': '다음', 'lbl_loading': '불러오는 중...', 'lbl_updated': '업데이트'
     },
     'zh': {
         'title': 'Cisco 多域资产管理仪表板',
@@ -55,7 +72,10 @@ UI_TEXT = {
         'lbl_total': '设备总数',
         'lbl_controller_breakdown': '按控制器细分',
         'col_domain': '域', 'col_controller': '控制器 / 站点', 'col_name': '主机名 (点击查看详情)', 
-        'col_model': '型号', 'col_serial': '序列号 / UUID', 'col_version': '版本', 'col_ip': '管理 IP / System IP'
+        'col_model': '型号', 'col_serial': '序列号 / UUID', 'col_version': '版本', 'col_ip': '管理 IP / System IP',
+        'col_also_in': '其他管理来源',
+        'lbl_search': '按主机名 / 序列号 / IP 搜索', 'lbl_all_domains': '所有域', 'lbl_all_controllers': '所有控制器',
+        'lbl_status': '状态', 'btn_prev': '上一页', 'btn_next': '下一页', 'lbl_loading': '加载中...', 'lbl_updated': '更新于'
     }
 }
 
@@ -110,6 +130,7 @@ HTML_TEMPLATE = """
         .device-link:hover { text-decoration: underline; color: #007cba; }
         
         .controller-name { font-weight: bold; color: #555; }
+        th.sortable { cursor: pointer; }
         
         .export-area { margin-top: 30px; text-align: center; }
     </style>
@@ -182,10 +203,10 @@ HTML_TEMPLATE = """
             </div>
         </div>
 
-        {% if stats.controllers %}
+        {% if controllers %}
         <h6 class="text-secondary mb-2 ms-1"><i class="bi bi-diagram-2"></i> {{ ui.lbl_controller_breakdown }}</h6>
         <div class="row mb-4 g-3">
-            {% for ctrl, info in stats.controllers.items() %}
+            {% for ctrl, info in controllers %}
             <div class="col-xl-2 col-lg-3 col-md-4 col-sm-6">
                 <div class="card ctrl-card ctrl-card-{{ info.domain|lower }} h-100">
                     <div class="card-body py-2 px-3">
@@ -194,6 +215,14 @@ HTML_TEMPLATE = """
                         </div>
                         <div class="text-dark fw-bold text-truncate" title="{{ ctrl }}">{{ ctrl }}</div>
                         <div class="fs-4 fw-bold text-dark mt-1">{{ info.count }}</div>
+                        <div class="text-muted" style="font-size: 0.7rem;">
+                            <i class="bi bi-clock"></i> {{ ui.lbl_updated }} <span class="js-time" data-ts="{{ info.fetched_at }}">-</span>
+                        </div>
+                        {% if info.error %}
+                        <div class="text-danger text-truncate" style="font-size: 0.7rem;" title="{{ info.error }}">
+                            <i class="bi bi-exclamation-triangle"></i> {{ info.error }}
+                        </div>
+                        {% endif %}
                     </div>
                 </div>
             </div>
@@ -201,94 +230,284 @@ HTML_TEMPLATE = """
         </div>
         {% endif %}
 
+        <form id="device-filters" class="row g-2 mb-2" onsubmit="return false;">
+            <div class="col-md-4">
+                <input type="search" name="q" class="form-control form-control-sm" placeholder="{{ ui.lbl_search }}">
+            </div>
+            <div class="col-md-2">
+                <select name="domain" class="form-select form-select-sm">
+                    <option value="">{{ ui.lbl_all_domains }}</option>
+                    <option value="ACI">ACI</option>
+                    <option value="Meraki">Meraki</option>
+                    <option value="Catalyst">Catalyst</option>
+                    <option value="SDWAN">SD-WAN</option>
+                </select>
+            </div>
+            <div class="col-md-3">
+                <select name="controller" class="form-select form-select-sm">
+                    <option value="">{{ ui.lbl_all_controllers }}</option>
+                    {% for ctrl in stats.controllers %}
+                    <option value="{{ ctrl }}">{{ ctrl }}</option>
+                    {% endfor %}
+                </select>
+            </div>
+            <div class="col-md-2">
+                <input type="text" name="status" class="form-control form-control-sm" placeholder="{{ ui.lbl_status }}">
+            </div>
+        </form>
+
         <div class="card border-0 shadow-sm">
             <div class="card-body p-0">
                 <div class="table-responsive">
                     <table class="table table-hover mb-0 align-middle">
                         <thead class="table-dark">
                             <tr>
-                                <th>{{ ui.col_domain }}</th>
-                                <th>{{ ui.col_controller }}</th>
-                                <th>{{ ui.col_name }}</th>
-                                <th>{{ ui.col_model }}</th>
-                                <th>{{ ui.col_serial }}</th>
-                                <th>{{ ui.col_version }}</th>
-                                <th>{{ ui.col_ip }}</th>
+                                <th class="sortable" data-sort="domain">{{ ui.col_domain }}</th>
+                                <th class="sortable" data-sort="controller">{{ ui.col_controller }}</th>
+                                <th class="sortable" data-sort="name">{{ ui.col_name }}</th>
+                                <th class="sortable" data-sort="model">{{ ui.col_model }}</th>
+                                <th class="sortable" data-sort="serial">{{ ui.col_serial }}</th>
+                                <th class="sortable" data-sort="version">{{ ui.col_version }}</th>
+                                <th class="sortable" data-sort="ip">{{ ui.col_ip }}</th>
+                                <th>{{ ui.col_also_in }}</th>
                             </tr>
                         </thead>
-                        <tbody>
-                            {% for row in data %}
-                            {% if not row.error %}
-                            <tr>
-                                <td><span class="badge badge-{{ row.domain|lower }}">{{ row.domain }}</span></td>
-                                <td class="controller-name">{{ row.controller }}</td>
-                                <td><a href="{{ row.dashboard_url }}" target="_blank" class="device-link">{{ row.name }}</a></td>
-                                <td>{{ row.model }}</td>
-                                <td><code class="text-muted">{{ row.serial }}</code></td>
-                                <td><small>{{ row.version }}</small></td>
-                                <td>{{ row.ip }}</td>
-                            </tr>
-                            {% endif %}
-                            {% endfor %}
+                        <tbody id="device-rows">
+                            <tr><td colspan="8" class="text-center text-muted">{{ ui.lbl_loading }}</td></tr>
                         </tbody>
                     </table>
                 </div>
             </div>
         </div>
 
+        <div class="d-flex justify-content-between align-items-center mt-2">
+            <small id="page-info" class="text-muted"></small>
+            <div class="btn-group">
+                <button id="page-prev" class="btn btn-sm btn-outline-secondary">{{ ui.btn_prev }}</button>
+                <button id="page-next" class="btn btn-sm btn-outline-secondary">{{ ui.btn_next }}</button>
+            </div>
+        </div>
+
         <div class="export-area">
             <a href="/export" class="btn btn-success btn-lg shadow">
                 <i class="bi bi-file-earmark-spreadsheet"></i> {{ ui.btn_csv }}
             </a>
         </div>
     </div>
+
+    <script>
+    // コントローラごとの最終更新時刻をブラウザのローカル時刻で表示
+    document.querySelectorAll('.js-time').forEach(e => {
+        const ts = parseFloat(e.dataset.ts);
+        if (ts > 0) e.textContent = new Date(ts * 1000).toLocaleString();
+    });
+
+    // デバイス一覧は /api/devices からページ単位で取得する
+    (function () {
+        const PAGE_SIZE = {{ page_size }};
+        const form = document.getElementById('device-filters');
+        const tbody = document.getElementById('device-rows');
+        const state = { offset: 0, sort: '', order: 'asc' };
+        let timer = null;
+
+        function cell(tr, child, cls) {
+            const td = document.createElement('td');
+            if (cls) td.className = cls;
+            td.appendChild(child);
+            tr.appendChild(td);
+        }
+        function el(tag, text, cls) {
+            const e = document.createElement(tag);
+            e.textContent = text == null ? '' : text;
+            if (cls) e.className = cls;
+            return e;
+        }
+
+        function load() {
+            const params = new URLSearchParams(new FormData(form));
+            params.set('offset', state.offset);
+            params.set('limit', PAGE_SIZE);
+            if (state.sort) { params.set('sort', state.sort); params.set('order', state.order); }
+            fetch('/api/devices?' + params.toString())
+                .then(r => r.json())
+                .then(page => {
+                    tbody.replaceChildren();
+                    page.devices.forEach(row => {
+                        const tr = document.createElement('tr');
+                        const domain = String(row.domain || '');
+                        cell(tr, el('span', domain, 'badge badge-' + domain.toLowerCase()));
+                        cell(tr, document.createTextNode(row.controller || ''), 'controller-name');
+                        const link = el('a', row.name, 'device-link');
+                        link.href = row.dashboard_url || '#';
+                        link.target = '_blank';
+                        cell(tr, link);
+                        cell(tr, document.createTextNode(row.model || ''));
+                        cell(tr, el('code', row.serial, 'text-muted'));
+                        cell(tr, el('small', row.version));
+                        cell(tr, document.createTextNode(row.ip || ''));
+                        // 他のコントローラにも登録されている同一機器 (シリアル / 管理IP の一致)
+                        const also = document.createElement('span');
+                        (row.also_in || []).forEach(o => {
+                            const badge = el('span', o.controller, 'badge me-1 badge-' + String(o.domain).toLowerCase());
+                            badge.title = o.domain + ' / ' + (o.name || '');
+                            also.appendChild(badge);
+                        });
+                        cell(tr, also);
+                        tbody.appendChild(tr);
+                    });
+                    const end = page.offset + page.devices.length;
+                    document.getElementById('page-info').textContent =
+                        (page.total ? page.offset + 1 : 0) + ' - ' + end + ' / ' + page.total;
+                    document.getElementById('page-prev').disabled = page.offset === 0;
+                    document.getElementById('page-next').disabled = page.next_offset === null;
+                });
+        }
+
+        form.addEventListener('input', () => {
+            clearTimeout(timer);
+            timer = setTimeout(() => { state.offset = 0; load(); }, 250);
+        });
+        document.getElementById('page-prev').addEventListener('click', () => {
+            state.offset = Math.max(0, state.offset - PAGE_SIZE); load();
+        });
+        document.getElementById('page-next').addEventListener('click', () => {
+            state.offset += PAGE_SIZE; load();
+        });
+        document.querySelectorAll('th.sortable').forEach(th => th.addEventListener('click', () => {
+            const key = th.dataset.sort;
+            state.order = (state.sort === key && state.order === 'asc') ? 'desc' : 'asc';
+            state.sort = key;
+            state.offset = 0;
+            load();
+        }));
+        load();
+    })();
+    </script>
 </body>
 </html>
 """
 
-def get_data_with_cache(force=False):
-    global DATA_CACHE, LAST_UPDATE
-    now = time.time()
-    if DATA_CACHE is not None and not force and (now - LAST_UPDATE < CACHE_DURATION):
-        return DATA_CACHE
-    
-    print("📡 Fetching fresh data via Core Logic...")
-    data = get_all_inventory()
-    DATA_CACHE = data
-    LAST_UPDATE = now
-    return data
-
-def calculate_stats(data):
-    """データからドメインごとの台数と、コントローラごとの台数・ドメイン情報を集計する"""
-    stats = {
-        'total': 0, 
-        'aci': 0, 'meraki': 0, 'catalyst': 0, 'sdwan': 0,
-        'controllers': {} # { 'CtrlName': {'count': 5, 'domain': 'ACI'}, ... }
+# --- 描画キャッシュ ---
+# テンプレートは起動時に1回だけコンパイルし、描画結果は言語ごとにデータのバージョン単位で再利用する
+PAGE_TEMPLATE = app.jinja_env.from_string(HTML_TEMPLATE)
+PAGE_CACHE = {}          # lang -> (version, html)
+RENDER_LOCK = threading.Lock()
+# プロセス再起動でバージョン番号が戻っても ETag が衝突しないようにする
+BOOT_ID = format(int(time.time() * 1000), 'x')
+
+def set_validators(response, etag, last_modified):
+    """ETag / Last-Modified を付与する（毎回再検証させる）"""
+    response.set_etag(etag)
+    if last_modified:
+        response.last_modified = last_modified
+    response.cache_control.no_cache = True
+    return response
+
+def conditional(response, etag, last_modified):
+    """ETag / Last-Modified を付与し、If-None-Match / If-Modified-Since に一致すれば 304 にする"""
+    return set_validators(response, etag, last_modified).make_conditional(request)
+
+def not_modified(etag, last_modified):
+    """
+    If-None-Match / If-Modified-Since が一致すれば 304 のレスポンスを、そうでなければ None を返す。
+    make_conditional はストリーミング本文を全部読み込んでしまうため、/export ではこちらを先に使う。
+    """
+    if request.if_none_match:
+        matched = request.if_none_match.contains(etag)
+    elif last_modified and request.if_modified_since:
+        matched = int(last_modified) <= request.if_modified_since.timestamp()
+    else:
+        matched = False
+    if not matched:
+        return None
+    return set_validators(Response(status=304), etag, last_modified)
+
+# --- バックグラウンド更新 ---
+REFRESH_TICK = 1.0 # スケジューラの確認間隔 (秒)
+# 予定時刻に、更新間隔のこの割合より新しいデータ（shared_cache では他のワーカーが取得したものを含む）があれば再取得しない。
+# 自分の前回の取得は完了時刻が予定より取得時間の分だけ遅れるため、1 より小さくしておく
+REFRESH_FRESHNESS = 0.9
+
+class BackgroundRefresher(threading.Thread):
+    """
+    コントローラごとの更新間隔で再取得を行うスケジューラ。
+    初回の実行時刻は間隔内で均等にずらし、全コントローラが同時に取得しないようにする。
+    画面のリクエストは常にキャッシュ（最後に正常取得したデータ）から返す。
+    shared_cache で複数のワーカーが動いていても、いずれかが最近取得したコントローラは取得し直さない。
+    """
+
+    def __init__(self, tick=REFRESH_TICK):
+        super().__init__(name="inventory-refresher", daemon=True)
+        self.tick = tick
+        self.next_due = {}
+        self.stop_event = threading.Event()
+
+    def run(self):
+        while not self.stop_event.wait(self.tick):
+            self.run_pending(time.time())
+
+    def run_pending(self, now):
+        controllers = list_controllers()
+        next_due = {}
+        for i, (kind, site) in enumerate(controllers):
+            key = (kind, controller_name(site))
+            interval = refresh_interval(kind, site)
+            due = self.next_due.get(key)
+            if due is None:
+                due = now + interval * (i + 1) / len(controllers)
+            elif now >= due:
+                refresh_controller(kind, site, max_age=interval * REFRESH_FRESHNESS)
+                due = now + interval
+            next_due[key] = due
+        self.next_due = next_due
+
+    def stop(self):
+        self.stop_event.set()
+
+_BACKGROUND = None # (pid, BackgroundRefresher): 開始したプロセスと更新スレッド
+_BACKGROUND_LOCK = threading.Lock()
+
+def start_background():
+    """
+    ウォームスタートとバックグラウンド更新をこのプロセスで1回だけ開始する。
+    gunicorn 等でモジュールを import して起動した場合も、各ワーカーの最初のリクエストで開始する
+    （fork 前に開始したスレッドは子プロセスに引き継がれないため、pid が変われば開始し直す）。
+    """
+    global _BACKGROUND
+    with _BACKGROUND_LOCK:
+        if _BACKGROUND is None or _BACKGROUND[0] != os.getpid():
+            # 前回のスナップショットで即座に表示可能にし、最新化は裏で行う
+            warm_start()
+            refresher = BackgroundRefresher()
+            refresher.start()
+            _BACKGROUND = (os.getpid(), refresher)
+        return _BACKGROUND[1]
+
+@app.before_request
+def ensure_background():
+    if _BACKGROUND is None or _BACKGROUND[0] != os.getpid():
+        start_background()
+
+def controller_cards(states):
+    """コントローラ別カードの表示内容（台数・最終更新時刻・直近のエラー）"""
+    return [(state['controller'], {
+        'domain': state['domain'],
+        'count': state['devices'],
+        'fetched_at': state['fetched_at'],
+        'error': state['error']
+    }) for state in states.values()]
+
+def calculate_stats(summary):
+    """Core の集計値から、ドメインごとの台数とコントローラごとの台数を取り出す（デバイス行は走査しない）"""
+    by_domain = {d.lower(): n for d, n in summary['by_domain'].items()}
+    return {
+        'total': summary['total_devices'],
+        'aci': by_domain.get('aci', 0),
+        'meraki': by_domain.get('meraki', 0),
+        'catalyst': by_domain.get('catalyst', 0),
+        'sdwan': by_domain.get('sdwan', 0),
+        'controllers': {ctrl: {'count': n} for ctrl, n in summary['by_controller'].items()}
     }
-    
-    for row in data:
-        if "error" in row: continue
-        
-        # Total Count
-        stats['total'] += 1
-        
-        # Domain Count
-        domain = row.get('domain', '').strip()
-        d_lower = domain.lower()
-        if 'aci' in d_lower: stats['aci'] += 1
-        elif 'meraki' in d_lower: stats['meraki'] += 1
-        elif 'catalyst' in d_lower: stats['catalyst'] += 1
-        elif 'sdwan' in d_lower: stats['sdwan'] += 1
-        
-        # Controller Count & Metadata
-        ctrl = row.get('controller', 'Unknown')
-        
-        if ctrl not in stats['controllers']:
-            stats['controllers'][ctrl] = {'count': 0, 'domain': domain}
-            
-        stats['controllers'][ctrl]['count'] += 1
-        
-    return stats
 
 # --- ルーティング ---
 
@@ -299,34 +518,84 @@ def index_root():
 @app.route('/<lang>')
 def index_lang(lang):
     target_lang = lang if lang in UI_TEXT else 'en'
-    data = get_data_with_cache(force=False)
-    stats = calculate_stats(data)
-    
-    # テンプレートに渡すデータに stats を追加
-    render_params = {
-        'lang': target_lang,
-        'ui': UI_TEXT[target_lang],
-        'data': data,
-        'stats': stats
-    }
-    
-    return render_template_string(HTML_TEMPLATE, **render_params)
+    # バージョンはデータより先に読む (返すデータは常にこのバージョン以降)
+    # コントローラ別カードに最終取得時刻・エラーを表示するため、ETag も Last-Modified も取得状況から付ける
+    version, updated_at = get_state_version()
+    summary = get_inventory_summary()
+
+    with RENDER_LOCK:
+        cached = PAGE_CACHE.get(target_lang)
+        if cached is not None and cached[0] == version:
+            html = cached[1]
+        else:
+            stats = calculate_stats(summary)
+            # テンプレートに渡すデータに stats を追加
+            # デバイス行はテンプレートに埋め込まず、ブラウザが /api/devices からページ単位で取得する
+            render_params = {
+                'lang': target_lang,
+                'ui': UI_TEXT[target_lang],
+                'stats': stats,
+                'controllers': controller_cards(get_controller_states()),
+                'page_size': API_PAGE_SIZE
+            }
+            html = PAGE_TEMPLATE.render(**render_params)
+            PAGE_CACHE[target_lang] = (version, html)
+
+    return conditional(make_response(html), f"{BOOT_ID}-{version}-{target_lang}", updated_at)
+
+@app.route('/api/devices')
+def api_devices():
+    """
+    デバイス一覧のJSON API (サーバー側でフィルタ・ソート・ページング)
+    クエリ: domain, controller, status, q (部分一致), sort, order (asc|desc), offset, limit
+    """
+    args = request.args
+    try:
+        offset = max(0, int(args.get('offset', 0)))
+        limit = min(API_MAX_PAGE_SIZE, max(1, int(args.get('limit', API_PAGE_SIZE))))
+    except ValueError:
+        return jsonify({'error': 'offset and limit must be integers'}), 400
+
+    rows = query_inventory(
+        domain=args.get('domain'),
+        controller=args.get('controller'),
+        status=args.get('status'),
+        text=args.get('q'),
+        sort=args.get('sort'),
+        descending=args.get('order') == 'desc'
+    )
+    end = offset + limit
+    # also_in: 同じ機器が登録されている他のコントローラ (相関はインデックス構築時に計算済み)
+    index = get_inventory_index()
+    devices = []
+    for r in rows[offset:end]:
+        device = r.to_dict() if isinstance(r, Device) else dict(r)
+        device['also_in'] = [{'domain': o.get('domain'), 'controller': o.get('controller'), 'name': o.get('name')}
+                             for o in index.correlated(r)]
+        devices.append(device)
+    return jsonify({
+        'total': len(rows),
+        'offset': offset,
+        'limit': limit,
+        'next_offset': end if end < len(rows) else None,
+        'devices': devices
+    })
 
 @app.route('/refresh/<lang>')
 def refresh_data(lang):
-    get_data_with_cache(force=True)
+    # 再取得はバックグラウンドで開始し、画面はすぐに現在のデータで返す
+    refresh_all()
     return redirect(url_for('index_lang', lang=lang))
 
-@app.route('/export')
-def export():
-    data = get_data_with_cache(force=False)
+EXPORT_CHUNK_ROWS = 500 # 1チャンクあたりの行数
+
+def iter_csv(rows):
+    """CSVを一定行数ごとのチャンクとして順に生成する"""
     si = io.StringIO()
     cw = csv.writer(si)
     # CSVヘッダー
     cw.writerow(['Domain', 'Controller/Site', 'Name', 'Model', 'Serial/UUID', 'Version', 'IP Address', 'Dashboard URL'])
-    
-    for row in data:
-        if "error" in row: continue
+    for i, row in enumerate(rows, 1):
         cw.writerow([
             row.get('domain'), 
             row.get('controller', '-'),
@@ -337,12 +606,117 @@ def export():
             row.get('ip'), 
             row.get('dashboard_url')
         ])
-    
-    res = make_response(si.getvalue())
-    res.headers["Content-Disposition"] = "attachment; filename=cisco_inventory.csv"
-    res.headers["Content-type"] = "text/csv"
-    return res
+        if i % EXPORT_CHUNK_ROWS == 0:
+            yield si.getvalue()
+            si.seek(0)
+            si.truncate(0)
+    yield si.getvalue()
+
+def iter_ndjson(rows):
+    """1行1デバイスのJSON (NDJSON) を一定行数ごとのチャンクとして順に生成する"""
+    chunk = []
+    for row in rows:
+        chunk.append(json.dumps(row, ensure_ascii=False, default=json_default))
+        if len(chunk) == EXPORT_CHUNK_ROWS:
+            yield "\n".join(chunk) + "\n"
+            chunk = []
+    if chunk:
+        yield "\n".join(chunk) + "\n"
+
+def iter_gzip(chunks):
+    """テキストのチャンクを逐次 gzip 圧縮して返す"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) # wbits=31: gzip 形式
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+@app.route('/export')
+def export():
+    """
+    インベントリのエクスポート（全件をメモリに溜めずにチャンク転送でストリーミング）
+    クエリ: format (csv|ndjson), gzip (1で圧縮), domain, controller, status, q
+    """
+    args = request.args
+    fmt = args.get('format', 'csv').lower()
+    if fmt not in ('csv', 'ndjson'):
+        return jsonify({'error': "format must be 'csv' or 'ndjson'"}), 400
+    # ETag は実際に返すインデックスのバージョンで付ける（再構築中は直前のデータを返すため）
+    index = get_inventory_index()
+    version, updated_at = index.version, index.updated_at
+    query_hash = hashlib.sha1(request.query_string).hexdigest()[:12]
+    etag = f"{BOOT_ID}-{version}-{query_hash}"
+    cached = not_modified(etag, updated_at)
+    if cached is not None:
+        return cached
+    rows = query_inventory(
+        domain=args.get('domain'),
+        controller=args.get('controller'),
+        status=args.get('status'),
+        text=args.get('q')
+    )
+
+    if fmt == 'ndjson':
+        body, mimetype, filename = iter_ndjson(rows), 'application/x-ndjson', 'cisco_inventory.ndjson'
+    else:
+        body, mimetype, filename = iter_csv(rows), 'text/csv', 'cisco_inventory.csv'
+    if args.get('gzip') in ('1', 'true', 'yes'):
+        body, mimetype, filename = iter_gzip(body), 'application/gzip', filename + '.gz'
+
+    res = Response(body, mimetype=mimetype)
+    res.headers["Content-Disposition"] = f"attachment; filename={filename}"
+    # 本文はジェネレータのまま返す（make_conditional を通すと全件がメモリに展開される）
+    return set_validators(res, etag, updated_at)
+
+def _labels(**labels):
+    """Prometheus のラベル表記（値の \\ " 改行をエスケープ）"""
+    def esc(v):
+        return str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{k}="{esc(v)}"' for k, v in labels.items()) + '}'
+
+# get_request_stats のキー -> (メトリクス名, 説明)
+REQUEST_METRICS = {
+    'requests': ('inventory_http_requests_total', 'HTTP requests sent to the controller.'),
+    'throttled': ('inventory_http_throttled_total', 'Responses with HTTP 429.'),
+    'retried': ('inventory_http_retries_total', 'Requests retried after 429/5xx.'),
+    'failed': ('inventory_http_failed_total', 'Requests that still failed after all retries.'),
+}
+
+@app.route('/metrics')
+def metrics():
+    """収集処理のメトリクス (Prometheus テキスト形式)"""
+    lines = [
+        '# HELP inventory_phase_seconds Time spent per collection phase (auth, http, decode, transform, total).',
+        '# TYPE inventory_phase_seconds histogram',
+    ]
+    timings = get_timing_stats()
+    for t in timings.values():
+        for phase, h in t['phases'].items():
+            if not h['count']:
+                continue
+            base = dict(domain=t['domain'], controller=t['controller'], phase=phase)
+            for le, count in h['buckets']:
+                le = '+Inf' if le == float('inf') else f'{le:g}'
+                lines.append(f"inventory_phase_seconds_bucket{_labels(**base, le=le)} {count}")
+            lines.append(f"inventory_phase_seconds_sum{_labels(**base)} {h['sum']:.6f}")
+            lines.append(f"inventory_phase_seconds_count{_labels(**base)} {h['count']}")
+
+    lines += ['# HELP inventory_bytes_received_total Response bytes received from the controller.',
+              '# TYPE inventory_bytes_received_total counter']
+    for t in timings.values():
+        lines.append(f"inventory_bytes_received_total{_labels(domain=t['domain'], controller=t['controller'])} {t['bytes']}")
+
+    requests = get_request_stats()
+    for key, (name, help_text) in REQUEST_METRICS.items():
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+        for ctrl, stats in requests.items():
+            domain, _, controller = ctrl.partition('/')
+            lines.append(f"{name}{_labels(domain=domain, controller=controller)} {stats.get(key, 0)}")
+
+    return Response('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
 
 if __name__ == '__main__':
+    start_background()
     print("🚀 Full-Stack Inventory Server starting at http://127.0.0.1:5001")
     app.run(host='0.0.0.0', port=5001, debug=False)
\ No newline at end of file
@@ -0,0 +1,9 @@
+# Copyright 2026 Cisco Systems, Inc. and its affiliates
+#
+# SPDX-License-Identifier: MIT
+
+import os
+import sys
+
+# リポジトリ直下のモジュール (multidomain_inventory_*.py) を import できるようにする
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,89 @@
+# Copyright 2026 Cisco Systems, Inc. and its affiliates
+#
+# SPDX-License-Identifier: MIT
+
+"""InventoryCache: 内容が変わらない再取得でバージョン・スナップショットが増えないことを確認する"""
+
+import sqlite3
+
+import pytest
+
+import multidomain_inventory_core as core
+from multidomain_inventory_core import Device, InventoryCache, run_sync
+
+SITE = {"name": "a0", "host": "apic.example.com"}
+
+@pytest.fixture
+def fetched(tmp_path, monkeypatch):
+    """ACI 1台構成。返す dict の "version" を変えると取得内容が変わる"""
+    state = {"version": "1", "calls": 0}
+
+    async def fetch(site_config):
+        state["calls"] += 1
+        return [Device(f"node-{i}", "ACI", "a0", f"leaf-{i}", "active", "N9K", f"FDO{i}", state["version"],
+                       f"10.0.0.{i + 1}", ("https://apic.example.com/", None)) for i in range(3)]
+
+    monkeypatch.setattr(core, "FETCHERS", {"ACI": fetch})
+    # 設定の差し替えでプロセス全体のキャッシュが再取得を始めないようにする（呼び出し回数を数えるため）
+    monkeypatch.setattr(core, "_reload_controllers", lambda *args: None)
+    core.set_config({"SETTINGS": {"snapshot_path": str(tmp_path / "snapshots.db")}, "ACI": [SITE]})
+    yield state
+    core.set_config({})
+
+def table_counts():
+    conn = sqlite3.connect(core.get_snapshot_store().path)
+    try:
+        return {t: conn.execute(f"SELECT COUNT(*) FROM {t}").fetchone()[0] for t in ("snapshots", "revisions")}
+    finally:
+        conn.close()
+
+def test_unchanged_refetch_keeps_version_and_snapshot(fetched):
+    cache = InventoryCache()
+    rows = run_sync(cache.get("ACI", SITE))
+    run_sync(cache.save_snapshot())
+    version = cache.version
+    run_sync(cache.get("ACI", SITE, force=True))
+    run_sync(cache.save_snapshot())
+    assert fetched["calls"] == 2
+    assert cache.version == version
+    assert cache.entries[("ACI", "a0")].data is rows  # 同じ内容なら手元のリストを使い続ける
+    assert table_counts() == {"snapshots": 1, "revisions": 1}
+
+def test_changed_refetch_bumps_version_and_writes_revision(fetched):
+    cache = InventoryCache()
+    run_sync(cache.get("ACI", SITE))
+    run_sync(cache.save_snapshot())
+    version = cache.version
+    fetched["version"] = "2"
+    rows = run_sync(cache.get("ACI", SITE, force=True))
+    run_sync(cache.save_snapshot())
+    assert cache.version > version
+    assert [r["version"] for r in rows] == ["2"] * 3
+    assert table_counts() == {"snapshots": 2, "revisions": 2}
+
+def test_warm_start_rows_equal_fetched_rows(fetched):
+    first = InventoryCache()
+    run_sync(first.get("ACI", SITE))
+    run_sync(first.save_snapshot())
+    # 別プロセスの起動を想定: スナップショットから読んだ行と再取得した行が等しければ何も書かない
+    second = InventoryCache()
+    run_sync(second.warm_start())
+    version = second.version
+    run_sync(second.get("ACI", SITE, force=True))
+    run_sync(second.save_snapshot())
+    assert second.version == version
+    assert table_counts() == {"snapshots": 1, "revisions": 1}
+
+def test_refresh_skips_controller_fetched_recently_by_another_process(fetched, tmp_path):
+    core.set_config({"SETTINGS": {"snapshot_path": str(tmp_path / "shared.db"), "shared_cache": True}, "ACI": [SITE]})
+    worker1, worker2 = InventoryCache(), InventoryCache()
+    run_sync(worker1.refresh("ACI", SITE))
+    run_sync(worker1.save_snapshot())
+    assert fetched["calls"] == 1
+    # worker2 の定期更新: worker1 が直前に取得・保存した結果を取り込むだけで、コントローラには接続しない
+    rows = run_sync(worker2.refresh("ACI", SITE, max_age=60))
+    assert fetched["calls"] == 1
+    assert rows == worker1.entries[("ACI", "a0")].data
+    # 期限を過ぎていれば取得し直す
+    run_sync(worker2.refresh("ACI", SITE, max_age=0))
+    assert fetched["calls"] == 2
@@ -0,0 +1,126 @@
+# Copyright 2026 Cisco Systems, Inc. and its affiliates
+#
+# SPDX-License-Identifier: MIT
+
+"""JsonItemStream: チャンクの切れ目がどこにあっても json.loads と同じ結果になることを確認する"""
+
+import asyncio
+import json
+
+import pytest
+
+from multidomain_inventory_core import JsonItemStream
+
+ITEMS = [
+    {"name": "leaf-101", "serial": "FDO1234", "ip": "10.0.0.1"},
+    {"name": "quote \" and backslash \\ ", "escapes": "tab\t newline\n é \U0001F600 \\u0041"},
+    {"numbers": [0, -1, 12345678901234567890, 1.5, -2.5e-3, 6E+10], "flags": [True, False, None]},
+    {"nested": {"a": [{"b": []}, {}], "c": "]},[{"}},
+    "plain string item",
+    -42,
+    3.0,
+    [],
+    {},
+]
+
+async def _chunks(parts):
+    for part in parts:
+        yield part
+
+def _collect(parts, key=None, extras=None):
+    """parts をチャンクとして流し、(要素のリスト, バッチ数) を返す"""
+    async def run():
+        stream = JsonItemStream(_chunks(parts), key=key, extras=extras)
+        items, batches = [], 0
+        async for batch in stream.batches():
+            items.extend(batch)
+            batches += 1
+        return items, batches
+    return asyncio.run(run())
+
+def _splits(text):
+    """1か所で切った全パターンと、1文字ずつのチャンク"""
+    for i in range(len(text) + 1):
+        yield [text[:i], text[i:]]
+    yield list(text)
+
+@pytest.mark.parametrize("indent", [None, 2])
+def test_top_level_array_any_split(indent):
+    text = json.dumps(ITEMS, indent=indent, ensure_ascii=False)
+    for parts in _splits(text):
+        items, _ = _collect(parts)
+        assert items == json.loads(text), parts
+
+def test_ascii_escaped_text_any_split():
+    # \uXXXX エスケープやサロゲートペアの途中で切れても正しくデコードされる
+    text = json.dumps(ITEMS, ensure_ascii=True)
+    for parts in _splits(text):
+        assert _collect(parts)[0] == ITEMS
+
+def test_number_cut_at_chunk_end_is_not_truncated():
+    # "[1, 23" まで届いた時点で 23 を確定させず、続きの "45]" を待つ
+    items, _ = _collect(["[1, 23", "45, -0.", "5e", "1]"])
+    assert items == [1, 2345, -5.0]
+
+def test_trailing_number_at_end_of_stream():
+    assert _collect(["[7, 8", "9]"])[0] == [7, 89]
+
+def test_keyed_array_with_extras_any_split():
+    doc = {
+        "totalCount": "3",
+        "meta": {"note": "before \"imdata\" [1,2]"},
+        "imdata": [{"fabricNode": {"attributes": {"name": f"node-{i}", "id": str(i)}}} for i in range(3)],
+        "links": {"next": None},
+        "count": 3.5,
+    }
+    text = json.dumps(doc, indent=1)
+    for parts in _splits(text):
+        extras = {}
+        items, _ = _collect(parts, key="imdata", extras=extras)
+        assert items == doc["imdata"], parts
+        assert extras == {k: v for k, v in doc.items() if k != "imdata"}
+
+def test_keyed_array_missing_key():
+    extras = {}
+    items, _ = _collect(['{"response": ', '[1, 2]', ', "version": "1.0"}'], key="imdata", extras=extras)
+    assert items == []
+    assert extras == {"response": [1, 2], "version": "1.0"}
+
+def test_key_with_non_array_value_goes_to_extras():
+    extras = {}
+    items, _ = _collect(['{"imdata": {"error": "x"}}'], key="imdata", extras=extras)
+    assert items == [] and extras == {"imdata": {"error": "x"}}
+
+@pytest.mark.parametrize("text, key", [("[]", None), (" [ ] ", None), ("{}", "imdata"), ('{"imdata": []}', "imdata")])
+def test_empty(text, key):
+    assert _collect([text], key=key)[0] == []
+
+def test_items_are_yielded_per_chunk():
+    # 完結した要素はチャンクが届くたびに返し、全体を待たない
+    parts = ['[{"a": 1}, {"a"', ': 2}, {"a": 3}', "]"]
+    items, batches = _collect(parts)
+    assert items == [{"a": 1}, {"a": 2}, {"a": 3}]
+    assert batches == 2
+
+def test_number_at_chunk_end_waits_for_next_chunk():
+    # 末尾の数値だけは続きがあり得るため次のチャンクまで保留する
+    items, batches = _collect(["[1, 2", ", 3]"])
+    assert items == [1, 2, 3]
+    assert batches == 2
+
+def test_empty_chunks_are_ignored():
+    assert _collect(["", "[1", "", ",", "", "2]", ""])[0] == [1, 2]
+
+@pytest.mark.parametrize("parts", [
+    ["[1, 2"],                 # 配列が閉じていない
+    ['[{"a": "unterminated'],  # 文字列が閉じていない
+    ["[1 2]"],                 # 区切りが無い
+    ["[1,]"],                  # 末尾のカンマ
+])
+def test_malformed_stream_raises(parts):
+    with pytest.raises(ValueError):
+        _collect(parts)
+
+def test_keyed_object_malformed_separator():
+    with pytest.raises(ValueError):
+        _collect(['{"imdata": [1] "x": 2}'], key="imdata")
@@ -0,0 +1,51 @@
+# Copyright 2026 Cisco Systems, Inc. and its affiliates
+#
+# SPDX-License-Identifier: MIT
+
+"""encode_page: デバイスと重複機器 identity が同じカーソル形式でページングされることを確認する"""
+
+import json
+
+import pytest
+
+import multidomain_inventory_mcp as mcp_server
+
+DEVICES = [{"id": str(i), "name": f"sw-{i}", "serial": f"S{i}", "domain": "catalyst"} for i in range(5)]
+IDENTITIES = [
+    {"serials": [f"S{i}"], "ips": [], "matched_on": "serial", "controllers": ["a", "b"],
+     "devices": [{"id": str(i), "name": f"sw-{i}", "serial": f"S{i}", "domain": "catalyst"},
+                 {"id": f"m{i}", "name": f"sw-{i}", "serial": f"S{i}", "domain": "meraki"}]}
+    for i in range(3)
+]
+
+@pytest.mark.parametrize("rows, item", [(DEVICES, "devices"), (IDENTITIES, "identities")])
+def test_pages_follow_the_cursor(rows, item):
+    seen, cursor = [], None
+    while True:
+        page = json.loads(mcp_server.encode_page(rows, ["name"], 2, cursor, version=7, item=item))
+        assert page["total"] == len(rows)
+        seen += page[item]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+        assert cursor.startswith("7.")
+    assert len(seen) == len(rows)
+    if item == "identities":
+        assert seen[0]["matched_on"] == "serial"
+        assert seen[0]["devices"] == [{"name": "sw-0"}, {"name": "sw-0"}]
+    else:
+        assert seen[0] == {"name": "sw-0"}
+
+@pytest.mark.parametrize("item", ["devices", "identities"])
+def test_stale_and_invalid_cursors_are_rejected(item):
+    rows = DEVICES if item == "devices" else IDENTITIES
+    assert mcp_server.encode_page(rows, cursor="6.2", version=7, item=item).startswith("Error: the inventory has changed")
+    assert mcp_server.encode_page(rows, cursor="7.x", version=7, item=item).startswith("Error: invalid cursor")
+
+def test_paged_tools_share_the_parameter_docs():
+    for tool in (mcp_server.get_full_inventory, mcp_server.get_domain_inventory, mcp_server.search_devices,
+                 mcp_server.get_unhealthy_devices, mcp_server.find_cross_domain_devices):
+        assert tool.__doc__.count("Args:") == 1
+        assert "cursor: Pass the 'next_cursor' value" in tool.__doc__
+    assert "layout:" not in mcp_server.find_cross_domain_devices.__doc__
+    assert "identities per call" in mcp_server.find_cross_domain_devices.__doc__
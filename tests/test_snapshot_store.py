@@ -0,0 +1,152 @@
+# Copyright 2026 Cisco Systems, Inc. and its affiliates
+#
+# SPDX-License-Identifier: MIT
+
+"""SnapshotStore: 保存時のマージ・リビジョンの共有・世代番号・取得リースの確認"""
+
+import sqlite3
+
+import pytest
+
+import multidomain_inventory_core as core
+from multidomain_inventory_core import Device, SnapshotStore
+
+A0, A1, A2 = ("ACI", "a0"), ("ACI", "a1"), ("ACI", "a2")
+
+def rows(name, version="1", n=3):
+    return [Device(str(i), "ACI", name, f"node-{i}", "online", "m", f"S{i}", version, f"10.0.0.{i + 1}")
+            for i in range(n)]
+
+def versions(store, key, version=None):
+    controllers, _ = store.load(version)
+    return [r.get("version") for r in controllers[key][1]]
+
+@pytest.fixture
+def store(tmp_path):
+    return SnapshotStore(str(tmp_path / "snapshots.db"))
+
+def counts(store):
+    conn = sqlite3.connect(store.path)
+    try:
+        return {t: conn.execute(f"SELECT COUNT(*) FROM {t}").fetchone()[0]
+                for t in ("snapshots", "revisions", "revision_devices")}
+    finally:
+        conn.close()
+
+def test_save_and_load_round_trip(store):
+    version, saved = store.save({A0: (1.0, rows("a0"), None),
+                                 A1: (1.0, [{"domain": "ACI", "controller": "a1", "error": "timeout"}], None)})
+    controllers, (loaded, created_at) = store.load()
+    assert loaded == version == store.latest_version()
+    assert created_at > 0
+    assert list(controllers) == [A0, A1]
+    assert controllers[A0][1] == rows("a0")
+    assert controllers[A1][1] == [{"domain": "ACI", "controller": "a1", "error": "timeout"}]
+    assert {key: rev for key, (_, _, rev) in controllers.items()} == saved
+
+def test_reloaded_rows_equal_fetched_rows(store):
+    # 取得時の link の持ち方（共有 prefix のタプル / 固定 URL のタプル / 文字列）に関わらず、
+    # 読み込み直した行は取得した行と等しい（再取得のたびに新しいリビジョンを作らない）
+    fetched = [
+        Device("topology/pod-1/node-101", "ACI", "a0", "leaf-101", "active", "N9K", "FDO1", "15.2", "10.0.0.1",
+               ("https://apic.example.com/", None)),
+        Device("Q2XX-1", "Meraki", "m0", "ap-1", "online", "MR46", "Q2XX-1", "30.5", "Cloud Managed",
+               ("https://n1.meraki.com/devices/", "serial")),
+        Device("uuid-1", "Catalyst", "c0", "sw-1", "Reachable", "C9300", "FOC1", "17.9", "10.0.1.1",
+               "https://dnac.example.com/dna/provision/devices/inventory/device-details?deviceId=uuid-1"),
+        Device("uuid-2", "SDWAN", "s0", "edge-1", "normal", "vedge", "uuid-2", "20.9", "1.1.1.1", None),
+    ]
+    store.save({("ACI", "a0"): (1.0, fetched, None)})
+    reloaded = store.load()[0][("ACI", "a0")][1]
+    assert reloaded == fetched
+    assert [r.to_dict() for r in reloaded] == [r.to_dict() for r in fetched]
+
+def test_devices_without_or_with_duplicate_ids_are_kept(store):
+    # id の無いデバイス3台と、同じ id のデバイス2台
+    data = [Device(None, "SDWAN", "s0", f"edge-{i}", "normal", "vedge", None, "20.9", f"1.1.1.{i}")
+            for i in range(3)]
+    data += [Device("uuid-1", "SDWAN", "s0", name, "normal", "vedge", "uuid-1", "20.9", "1.1.2.1")
+             for name in ("edge-a", "edge-b")]
+    store.save({("SDWAN", "s0"): (1.0, data, None)})
+    assert store.load()[0][("SDWAN", "s0")][1] == data
+
+def test_unchanged_rows_only_touch_fetched_at(store):
+    version, saved = store.save({A0: (1.0, rows("a0"), None)})
+    before = counts(store)
+    again, _ = store.save({A0: (2.0, rows("a0"), saved[A0])})
+    assert again == version
+    assert counts(store) == before
+    assert store.load()[0][A0][0] == 2.0
+
+def test_changed_controller_shares_other_revisions(store):
+    _, saved = store.save({A0: (1.0, rows("a0"), None), A1: (1.0, rows("a1"), None)})
+    version, saved2 = store.save({A0: (2.0, rows("a0"), saved[A0]), A1: (2.0, rows("a1", "2"), None)})
+    assert version == 2
+    assert saved2[A0] == saved[A0] and saved2[A1] != saved[A1]
+    # 変わったコントローラの行だけが追加される
+    assert counts(store) == {"snapshots": 2, "revisions": 3, "revision_devices": 9}
+    assert versions(store, A1, 1) == ["1"] * 3
+    assert versions(store, A1, 2) == ["2"] * 3
+
+def test_newer_peer_data_is_not_overwritten(store):
+    _, peer = store.save({A0: (5.0, rows("a0", "peer"), None)})
+    version, saved = store.save({A0: (3.0, rows("a0", "stale"), None), A1: (3.0, rows("a1"), None)})
+    assert A0 not in saved  # 自分の行は使われていない
+    controllers, _ = store.load(version)
+    assert controllers[A0][0] == 5.0 and controllers[A0][2] == peer[A0]
+    assert versions(store, A0) == ["peer"] * 3
+
+def test_configured_controllers_are_carried_over(store):
+    store.save({A0: (1.0, rows("a0"), None), A1: (1.0, rows("a1"), None), A2: (1.0, rows("a2"), None)})
+    # 別プロセスは a0 しか取得していない: a1 は設定に残っているので引き継ぎ、a2 は設定から外れたので落とす
+    version, _ = store.save({A0: (2.0, rows("a0", "2"), None)}, configured={A0, A1})
+    controllers, _ = store.load(version)
+    assert list(controllers) == [A1, A0]
+    assert controllers[A1][0] == 1.0
+
+def test_prune_keeps_latest_versions_and_shared_revisions(store, monkeypatch):
+    monkeypatch.setattr(core, "SNAPSHOT_KEEP", 2)
+    _, saved = store.save({A0: (1.0, rows("a0"), None), A1: (1.0, rows("a1", "0"), None)})
+    for i in range(1, 4):
+        store.save({A0: (1.0 + i, rows("a0"), saved[A0]), A1: (1.0 + i, rows("a1", str(i)), None)})
+    conn = sqlite3.connect(store.path)
+    assert [v for (v,) in conn.execute("SELECT version FROM snapshots ORDER BY version")] == [3, 4]
+    assert store.load(1) == ({}, (None, None))
+    # a0 の最初のリビジョンは最新版からも参照されているので残る
+    assert store.load()[0][A0][2] == saved[A0]
+    assert counts(store) == {"snapshots": 2, "revisions": 3, "revision_devices": 9}
+
+def test_load_newer_reads_only_changed_controllers(store):
+    _, saved = store.save({A0: (1.0, rows("a0"), None), A1: (1.0, rows("a1"), None)})
+    generation, changed = store.load_newer(None, {}, {A0, A1})
+    assert set(changed) == {A0, A1}
+    known = {key: (fetched_at, rev) for key, (fetched_at, _, rev) in changed.items()}
+    assert store.load_newer(generation, known, {A0, A1}) == (generation, {})
+
+    # a0 は同じ内容で取得時刻だけ進み、a1 は内容が変わった
+    store.save({A0: (2.0, rows("a0"), saved[A0]), A1: (2.0, rows("a1", "2"), None)})
+    generation2, changed = store.load_newer(generation, known, {A0, A1})
+    assert generation2 > generation
+    assert changed[A0] == (2.0, None, saved[A0])  # 行は読み直さない
+    assert [r.get("version") for r in changed[A1][1]] == ["2"] * 3
+    # only に含まれないコントローラは読まない
+    assert store.load_newer(generation, known, {A0})[1].keys() == {A0}
+
+def test_load_newer_without_database(tmp_path):
+    store = SnapshotStore(str(tmp_path / "missing.db"))
+    assert store.load_newer(7, {}, {A0}) == (7, {})
+    assert store.latest_version() is None
+
+def test_lease_is_exclusive_until_released_or_expired(store, monkeypatch):
+    assert store.acquire_lease(A0, "p1", ttl=60)
+    assert not store.acquire_lease(A0, "p2", ttl=60)
+    assert store.acquire_lease(A0, "p1", ttl=60)  # 自分のリースは延長できる
+    assert store.acquire_lease(A1, "p2", ttl=60)  # コントローラごとに独立
+    store.release_lease(A0, "p2")                 # 他人のリースは解放できない
+    assert not store.acquire_lease(A0, "p2", ttl=60)
+    store.release_lease(A0, "p1")
+    assert store.acquire_lease(A0, "p2", ttl=60)
+
+    now = core.time.time()
+    monkeypatch.setattr(core.time, "time", lambda: now + 120)
+    assert store.acquire_lease(A0, "p3", ttl=60)  # 期限切れのリースは奪える